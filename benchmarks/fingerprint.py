@@ -0,0 +1,50 @@
+"""
+Lines per second of every line hash algorithm, and of the whole fingerprint of a file with each normalization pass.
+
+    python -m benchmarks.fingerprint [folder]
+"""
+import sys
+import time
+
+from src.binary import TEXT, sniff_file_kind, sniff_size
+from src.comparator import Comparator
+from src.fingerprint import BLAKE2B, NORMALIZATION_PASSES, SHA256, XXHASH, default_boilerplate_patterns
+
+
+def timed(function, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(folder_path: str = './resources'):
+    file_paths = []
+    for file_path in Comparator.get_file_paths_for_folder(folder_path):
+        with open(file_path, 'rb') as file:
+            if sniff_file_kind(file.read(sniff_size)) == TEXT:
+                file_paths.append(file_path)
+    lines = []
+    for file_path in file_paths:
+        lines.extend(line for line in Comparator.read_purified_lines(file_path) if line)
+    print(f'{len(file_paths)} files, {len(lines)} non-empty lines')
+
+    for algorithm in (SHA256, BLAKE2B, XXHASH):
+        try:
+            elapsed = timed(lambda: Comparator.calculate_line_hashes(lines, algorithm))
+        except ImportError as error:
+            print(f'{algorithm:>20}: skipped, {error}')
+            continue
+        print(f'{algorithm:>20}: {len(lines) / elapsed:,.0f} lines/s hashing only')
+
+    # whole fingerprints, reading, splitting, normalizing and hashing each file
+    for passes in [()] + [(normalization_pass,) for normalization_pass in NORMALIZATION_PASSES] + [NORMALIZATION_PASSES]:
+        settings = (BLAKE2B, passes, tuple(default_boilerplate_patterns), False)
+        elapsed = timed(lambda: [Comparator.fingerprint_file(file_path, settings) for file_path in file_paths])
+        print(f'{" + ".join(passes) or "no normalization":>20}: {len(lines) / elapsed:,.0f} lines/s fingerprinting with {BLAKE2B}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
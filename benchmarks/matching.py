@@ -0,0 +1,80 @@
+"""
+Benchmark of the matching engine against the former row/column scan of the dense comparison matrix.
+
+    python -m benchmarks.matching [files per side] [candidates per file]
+"""
+import random
+import sys
+import time
+
+from src.matching import match_mutual_best, match_optimal
+
+
+def legacy_row_column_scan(similarities: list[list[int]], similarity_lower_bound: int) -> list[tuple[int, int]]:
+    """ The matching loop of traverse_directories before the matching engine, on a dense similarity matrix. """
+    rows = list(range(len(similarities)))
+    columns = list(range(len(similarities[0]) if similarities else 0))
+    matches = []
+    rows_last_size = None
+    while rows_last_size != len(rows):
+        if len(rows) == 0 or len(columns) == 0:
+            break
+        rows_last_size = len(rows)
+        for i in rows:
+            best_j = columns[0]
+            for j in columns:
+                if similarities[i][j] > similarities[i][best_j]:
+                    best_j = j
+            best_i = rows[0]
+            for i_2 in rows:
+                if similarities[i_2][best_j] > similarities[best_i][best_j]:
+                    best_i = i_2
+            if best_i == i:
+                if similarities[i][best_j] <= similarity_lower_bound:
+                    continue
+                matches.append((i, best_j))
+                rows.remove(i)
+                columns.remove(best_j)
+                break
+    return matches
+
+
+def generate_scored_pairs(files_per_side: int, candidates_per_file: int, seed: int = 0):
+    rnd = random.Random(seed)
+    scored_pairs = {}
+    for i in range(files_per_side):
+        for j in rnd.sample(range(files_per_side), candidates_per_file):
+            # coarse similarities produce plenty of ties, which is what real reports look like
+            scored_pairs[(i, j)] = rnd.choice(range(0, 101, 5))
+    return [(i, j, pair_similarity) for (i, j), pair_similarity in scored_pairs.items()]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(files_per_side: int = 400, candidates_per_file: int = 8, similarity_lower_bound: int = 10):
+    scored_pairs = generate_scored_pairs(files_per_side, candidates_per_file)
+    dense = [[0] * files_per_side for _ in range(files_per_side)]
+    for i, j, pair_similarity in scored_pairs:
+        dense[i][j] = pair_similarity
+
+    legacy_matches, legacy_time = timed(legacy_row_column_scan, dense, similarity_lower_bound)
+    mutual_best_matches, mutual_best_time = timed(match_mutual_best, scored_pairs, similarity_lower_bound)
+    optimal_matches, optimal_time = timed(match_optimal, scored_pairs, similarity_lower_bound)
+
+    assert mutual_best_matches == legacy_matches, 'mutual best matching differs from the legacy scan'
+
+    def total_similarity(matches):
+        return sum(dense[i][j] for i, j in matches)
+
+    print(f'{files_per_side} files per side, {len(scored_pairs)} scored pairs')
+    print(f'legacy scan   {legacy_time:8.3f}s  {len(legacy_matches)} matches, total similarity {total_similarity(legacy_matches)}')
+    print(f'mutual best   {mutual_best_time:8.3f}s  {len(mutual_best_matches)} matches, total similarity {total_similarity(mutual_best_matches)}')
+    print(f'optimal       {optimal_time:8.3f}s  {len(optimal_matches)} matches, total similarity {total_similarity(optimal_matches)}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
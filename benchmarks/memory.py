@@ -0,0 +1,26 @@
+"""
+Memory held by the file metas of a folder, measured with tracemalloc.
+
+    python -m benchmarks.memory [folder]
+"""
+import sys
+import time
+import tracemalloc
+
+from src.comparator import Comparator
+
+
+def main(folder_path: str = './resources'):
+    tracemalloc.start()
+    start = time.perf_counter()
+    file_metas = Comparator.create_file_metas_for_folder(folder_path, workers=1)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    line_count = sum(len(file_meta.line_metas) for file_meta in file_metas)
+    print(f'{len(file_metas)} files, {line_count} lines in {elapsed:.3f}s')
+    print(f'retained {retained / 2 ** 20:.2f} MiB, peak {peak / 2 ** 20:.2f} MiB, {retained / max(line_count, 1):.0f} bytes per line')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
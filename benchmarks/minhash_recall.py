@@ -0,0 +1,79 @@
+"""
+Recall and precision of the MinHash candidate generation against the exact line index on the bundled repositories.
+
+    python -m benchmarks.minhash_recall [report file]
+"""
+import sys
+import time
+
+from src import repo_comparison
+from src.comparator import Comparator
+from src.line_index import LineHashIndex
+from src.matching import match
+from src.minhash import MinHashIndex
+
+configurations = [(64, 16), (128, 32), (128, 64), (256, 128)]
+
+
+def get_scored_pairs(first_file_metas, second_file_metas, candidate_pairs) -> dict[tuple[int, int], int]:
+    similarities = {}
+    for i, j in candidate_pairs:
+        similarities[(i, j)] = 100 - int(Comparator.get_uniqueness_scores(first_file_metas[i], [second_file_metas[j]])[0])
+    return similarities
+
+
+def main(report_file: str = './report/minhash_recall.md'):
+    first_file_metas = Comparator.create_file_metas_for_folder(repo_comparison.european_root)
+    second_file_metas = Comparator.create_file_metas_for_folder(repo_comparison.asia_root)
+    # identical files are paired by their hash before any candidate generation
+    second_hashes = {file_meta.file_hash for file_meta in second_file_metas}
+    first_hashes = {file_meta.file_hash for file_meta in first_file_metas}
+    first_file_metas = [file_meta for file_meta in first_file_metas if file_meta.file_hash not in second_hashes]
+    second_file_metas = [file_meta for file_meta in second_file_metas if file_meta.file_hash not in first_hashes]
+    lower_bound = repo_comparison.similarity_lower_bound
+    default = (repo_comparison.minhash_permutations, repo_comparison.minhash_bands)
+
+    start = time.perf_counter()
+    exact_candidates = LineHashIndex(first_file_metas).get_candidate_pairs(LineHashIndex(second_file_metas))
+    exact_time = time.perf_counter() - start
+    exact_similarities = get_scored_pairs(first_file_metas, second_file_metas, exact_candidates)
+    relevant = {pair for pair, pair_similarity in exact_similarities.items() if pair_similarity > lower_bound}
+    exact_matches = set(match([(i, j, s) for (i, j), s in exact_similarities.items()], lower_bound))
+
+    lines = [
+        f'MinHash candidate generation compared to the exact line index, '
+        f'{len(first_file_metas)} x {len(second_file_metas)} non identical files of '
+        f'{repo_comparison.european_root} and {repo_comparison.asia_root}.\\\n',
+        f'Relevant pairs are more than {lower_bound}% similar: {len(relevant)} of {len(exact_candidates)} '
+        f'exact candidates, {len(exact_matches)} matched pairs, index built in {exact_time:.3f}s.\n\n',
+        '| permutations | bands | candidates | recall | precision | matched pairs recovered | time |\n',
+        '|---|---|---|---|---|---|---|\n',
+    ]
+    recovered = {}
+    for permutations, bands in sorted(set(configurations) | {default}):
+        start = time.perf_counter()
+        candidates = MinHashIndex(first_file_metas, permutations, bands).get_candidate_pairs(
+            MinHashIndex(second_file_metas, permutations, bands))
+        elapsed = time.perf_counter() - start
+        found = relevant & candidates.keys()
+        similarities = {pair: exact_similarities.get(pair, 0) for pair in candidates}
+        matches = set(match([(i, j, s) for (i, j), s in similarities.items()], lower_bound))
+        recovered[(permutations, bands)] = len(matches & exact_matches)
+        label = ' (default)' if (permutations, bands) == default else ''
+        lines.append(
+            f'| {permutations}{label} | {bands} | {len(candidates)} | {len(found) / max(len(relevant), 1):.1%} '
+            f'| {len(found) / max(len(candidates), 1):.1%} | {len(matches & exact_matches)} of {len(exact_matches)} '
+            f'| {elapsed:.3f}s |\n'
+        )
+    lost = len(exact_matches) - recovered[default]
+    lines.append(f'\nThe default {default[0]} permutations in {default[1]} bands recover '
+                 + ('every matched pair of the exact line index.\n' if not lost else
+                    f'{recovered[default]} of {len(exact_matches)} matched pairs, {lost} matched pairs are lost.\n'))
+
+    with open(report_file, 'w+') as f_report:
+        f_report.writelines(lines)
+    print(''.join(lines))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,205 @@
+"""
+Benchmark suite of whole comparisons of synthetic repositories: the time of every phase of
+repo_comparison.traverse_directories, throughput and peak RSS of each scenario, written as JSON.
+
+    python -m benchmarks.suite [--scenarios small medium ...] [--cached] [--workers 1] [--repeat 3]
+                               [--output results.json] [--baseline baseline.json] [--tolerance 0.25]
+
+Every scenario runs --repeat times, each time in a process of its own so that the peak RSS is the one of the
+scenario, and the fastest time of every phase is kept. The settings of a scenario are set in repo_comparison.
+With --cached a scenario is also run from a warm fingerprint cache. With --baseline, the output of an earlier run on the same machine, phases slower and peak RSS higher than the
+baseline by more than the tolerance are reported as regressions, and the exit code is 1.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import SyntheticRepositoryGenerator
+
+SCENARIOS = {
+    'small': {'files': 200, 'lines_per_file': 100},
+    'medium': {'files': 1000, 'lines_per_file': 200},
+    'large': {'files': 4000, 'lines_per_file': 300},
+    'boilerplate': {'files': 1000, 'lines_per_file': 200, 'boilerplate_density': 0.5},
+    # boilerplate lines do not make pairs candidates, most pairs are not compared
+    'boilerplate_pruned': {'files': 1000, 'lines_per_file': 200, 'boilerplate_density': 0.5,
+                           'settings': {'max_line_occurrences': 100, 'min_shared_lines': 2}},
+    # a dense candidate graph of about 1400 by 1400 files matched optimally
+    'boilerplate_optimal': {'files': 2000, 'lines_per_file': 200, 'boilerplate_density': 0.5,
+                            'settings': {'matching_mode': 'optimal'}},
+    'edited': {'files': 1000, 'lines_per_file': 200, 'duplicate_ratio': 0.05, 'partial_edit_rate': 0.9},
+}
+DEFAULT_SCENARIOS = ['small', 'medium']
+COLD = 'cold'
+CACHED = 'cached'
+# phases faster than this in the baseline are too short to be compared
+MIN_COMPARED_SECONDS = 0.05
+
+
+def get_peak_rss_mib(who: int) -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(who).ru_maxrss
+    return peak_rss / 2 ** 20 if sys.platform == 'darwin' else peak_rss / 2 ** 10
+
+
+def configure_run(directory: str, workers: int, cached: bool, settings: dict):
+    from src import comparator, repo_comparison
+    report_directory = os.path.join(directory, 'report')
+    os.makedirs(report_directory, exist_ok=True)
+    comparator.ingestion_workers = workers
+    repo_comparison.similarity_bar_chart_picture_directory = report_directory
+    for report_file in ('duplicated_report_file', 'partially_duplicated_report_file',
+                        'partially_duplicated_detailed_report_file', 'fully_unique_files', 'clone_report_file'):
+        setattr(repo_comparison, report_file, os.path.join(report_directory, os.path.basename(getattr(repo_comparison, report_file))))
+    repo_comparison.fingerprint_cache_file = os.path.join(directory, 'fingerprints.sqlite') if cached else None
+    repo_comparison.incremental_state_file = None
+    for name, value in settings.items():
+        setattr(repo_comparison, name, value)
+
+
+def run_scenario(name: str, mode: str, workers: int) -> dict:
+    """
+    Generates the repositories of the scenario and compares them, in this process.
+    """
+    from src import instrumentation, repo_comparison
+
+    with tempfile.TemporaryDirectory() as directory:
+        scenario = dict(SCENARIOS[name])
+        settings = scenario.pop('settings', {})
+        parameters = SyntheticRepositoryGenerator().generate(directory, **scenario)
+        configure_run(directory, workers, mode == CACHED, settings)
+        first, second = os.path.join(directory, 'first'), os.path.join(directory, 'second')
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if mode == CACHED:
+                repo_comparison.traverse_directories(first, second)
+            run_instrumentation = instrumentation.Instrumentation()
+            instrumentation.activate(run_instrumentation)
+            started = time.perf_counter()
+            repo_comparison.traverse_directories(first, second)
+            total_seconds = time.perf_counter() - started
+            instrumentation.activate(None)
+
+    return {
+        'scenario': name,
+        'mode': mode,
+        'parameters': parameters,
+        'settings': settings,
+        'seconds': dict(run_instrumentation.seconds, total=total_seconds),
+        'counts': run_instrumentation.counts,
+        'peak_rss_mib': get_peak_rss_mib(resource.RUSAGE_SELF),
+        'peak_rss_children_mib': get_peak_rss_mib(resource.RUSAGE_CHILDREN),
+    }
+
+
+def get_throughput(seconds: dict[str, float], counts: dict[str, int]) -> dict[str, float]:
+    def rate(count_name: str, phase: str) -> float:
+        return counts.get(count_name, 0) / seconds[phase] if seconds.get(phase) else 0.0
+    return {
+        'ingestion files/s': rate('files', 'ingestion'),
+        'ingestion lines/s': rate('lines', 'ingestion'),
+        'scoring pairs/s': rate('pairs scored', 'scoring'),
+        'matching pairs/s': rate('pairs scored', 'matching'),
+        'total files/s': rate('files', 'total'),
+        'total lines/s': rate('lines', 'total'),
+    }
+
+
+def run_scenario_processes(name: str, mode: str, workers: int, repeat: int) -> dict:
+    """
+    Runs the scenario repeat times, each in a new process, with the fastest time of every phase and the highest peak RSS.
+    """
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-m', 'benchmarks.suite', '--run-scenario', name, '--mode', mode,
+                                    '--workers', str(workers)], capture_output=True, text=True, check=True)
+        runs.append(json.loads(completed.stdout.splitlines()[-1]))
+    result = dict(runs[0], repeat=repeat)
+    result['seconds'] = {phase: min(run['seconds'][phase] for run in runs) for phase in runs[0]['seconds']}
+    result['throughput'] = get_throughput(result['seconds'], result['counts'])
+    result['peak_rss_mib'] = max(run['peak_rss_mib'] for run in runs)
+    result['peak_rss_children_mib'] = max(run['peak_rss_children_mib'] for run in runs)
+    return result
+
+
+def find_regressions(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    baseline_results = {(result['scenario'], result['mode']): result for result in baseline['scenarios']}
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get((result['scenario'], result['mode']))
+        if baseline_result is None:
+            continue
+        label = f'{result["scenario"]} {result["mode"]}'
+        for phase, baseline_seconds in baseline_result['seconds'].items():
+            seconds = result['seconds'].get(phase)
+            if seconds is not None and baseline_seconds >= MIN_COMPARED_SECONDS and seconds > baseline_seconds * (1 + tolerance):
+                regressions.append(f'{label}: {phase} took {seconds:.3f}s, {seconds / baseline_seconds - 1:.0%} more '
+                                   f'than the baseline {baseline_seconds:.3f}s')
+        if result['peak_rss_mib'] > baseline_result['peak_rss_mib'] * (1 + tolerance):
+            regressions.append(f'{label}: peak RSS {result["peak_rss_mib"]:.1f} MiB, '
+                               f'{result["peak_rss_mib"] / baseline_result["peak_rss_mib"] - 1:.0%} more than the '
+                               f'baseline {baseline_result["peak_rss_mib"]:.1f} MiB')
+    return regressions
+
+
+def format_result(result: dict) -> str:
+    phases = ', '.join(f'{phase} {seconds:.3f}s' for phase, seconds in result['seconds'].items() if phase != 'total')
+    throughput = result['throughput']
+    return f'{result["scenario"]} {result["mode"]}: {result["seconds"]["total"]:.3f}s, ' \
+           f'{throughput["ingestion files/s"]:,.0f} files/s and {throughput["ingestion lines/s"]:,.0f} lines/s ingested, ' \
+           f'{throughput["scoring pairs/s"]:,.0f} pairs/s scored, peak RSS {result["peak_rss_mib"]:.1f} MiB\n    {phases}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark whole comparisons of synthetic repositories')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=DEFAULT_SCENARIOS)
+    parser.add_argument('--cached', action='store_true', help='also run every scenario from a warm fingerprint cache')
+    parser.add_argument('--workers', type=int, default=1, help='processes hashing files')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every scenario, the fastest time of each phase is kept')
+    parser.add_argument('--output', help='file to write the JSON results to, printed otherwise')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative slowdown reported as a regression')
+    parser.add_argument('--run-scenario', choices=list(SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument('--mode', choices=[COLD, CACHED], default=COLD, help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.run_scenario:
+        print(json.dumps(run_scenario(arguments.run_scenario, arguments.mode, arguments.workers)))
+        return
+
+    results = []
+    for name in arguments.scenarios:
+        for mode in ([COLD, CACHED] if arguments.cached else [COLD]):
+            results.append(run_scenario_processes(name, mode, arguments.workers, arguments.repeat))
+            print(format_result(results[-1]), file=sys.stderr)
+    output = {
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                        'workers': arguments.workers, 'repeat': arguments.repeat},
+        'scenarios': results,
+    }
+    regressions = []
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), arguments.tolerance)
+        output['regressions'] = regressions
+        for regression in regressions:
+            print(f'Regression: {regression}', file=sys.stderr)
+        if not regressions:
+            print(f'No regression against {arguments.baseline}', file=sys.stderr)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(output, output_file, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Generates a pair of synthetic repositories to benchmark a comparison with, in <output>/first and <output>/second.
+
+    python -m benchmarks.synthetic <output> [files] [lines per file] [duplicate ratio] [partial edit rate] [boilerplate density]
+
+The second repository has a copy of duplicate_ratio of the files of the first one, another partial_edit_rate of
+them copied with some of their lines changed, inserted or deleted, and new files for the rest. A share of
+boilerplate_density of all lines comes from a few lines every file has, like closing braces and common imports.
+"""
+import os
+import random
+import sys
+
+BOILERPLATE_LINES = ['}', '});', ');', 'return null;', "import React from 'react';", 'export default {',
+                     "'use strict';", '</div>', '<div>', 'break;']
+STATEMENT_TEMPLATES = ['const {0} = {1}({2});', 'let {0} = {1}.{2};', 'if ({0} > {3}) {{', 'return {0} + {1};',
+                       '{0}.{1}({2}, {3});', 'for (const {0} of {1}) {{', 'this.{0} = {1};', "{0}['{1}'] = {3};",
+                       'await {0}.{1}();', 'function {0}({1}, {2}) {{']
+
+
+class SyntheticRepositoryGenerator:
+    """
+    Random source files of JavaScript-like lines, identifiers are drawn from a vocabulary large enough
+    that two files written independently share about as few lines as unrelated files of a real repository.
+    """
+
+    def __init__(self, seed: int = 0, vocabulary_size: int = 5000):
+        self.random = random.Random(seed)
+        self.vocabulary = [self.create_identifier() for _ in range(vocabulary_size)]
+
+    def create_identifier(self) -> str:
+        return ''.join(self.random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(self.random.randint(3, 10)))
+
+    def create_line(self, boilerplate_density: float) -> str:
+        if self.random.random() < boilerplate_density:
+            return self.random.choice(BOILERPLATE_LINES)
+        identifiers = self.random.sample(self.vocabulary, 3)
+        return '    ' * self.random.randint(0, 3) + self.random.choice(STATEMENT_TEMPLATES).format(
+            *identifiers, self.random.randint(0, 1000))
+
+    def create_file(self, line_count: int, boilerplate_density: float) -> list[str]:
+        return [self.create_line(boilerplate_density) for _ in range(line_count)]
+
+    def edit_file(self, lines: list[str], edit_fraction: float, boilerplate_density: float) -> list[str]:
+        """
+        Changes, inserts or deletes about edit_fraction of the lines, in runs of a few consecutive lines.
+        """
+        edited = list(lines)
+        edits = max(1, int(len(lines) * edit_fraction / 3))
+        for _ in range(edits):
+            position = self.random.randrange(len(edited) + 1)
+            run = self.random.randint(1, 5)
+            operation = self.random.random()
+            if operation < 0.4:
+                edited[position:position + run] = [self.create_line(boilerplate_density) for _ in range(run)]
+            elif operation < 0.7:
+                edited[position:position] = [self.create_line(boilerplate_density) for _ in range(run)]
+            else:
+                del edited[position:position + run]
+        return edited
+
+    def create_file_path(self, index: int) -> str:
+        depth = self.random.randint(0, 3)
+        folders = [self.random.choice(self.vocabulary[:50]) for _ in range(depth)]
+        return os.path.join('src', *folders, f'{self.random.choice(self.vocabulary)}_{index}.js')
+
+    def generate(self, output_path: str, files: int = 1000, lines_per_file: int = 200, duplicate_ratio: float = 0.3,
+                 partial_edit_rate: float = 0.4, boilerplate_density: float = 0.15, edit_fraction: float = 0.2) -> dict:
+        """
+        Writes both repositories and returns how they were generated, file and line counts included.
+        """
+        first_files, second_files = {}, {}
+        for index in range(files):
+            line_count = self.random.randint(max(1, lines_per_file // 2), lines_per_file * 3 // 2)
+            file_path = self.create_file_path(index)
+            lines = self.create_file(line_count, boilerplate_density)
+            first_files[file_path] = lines
+            kind = self.random.random()
+            if kind < duplicate_ratio:
+                second_files[file_path] = lines
+            elif kind < duplicate_ratio + partial_edit_rate:
+                second_files[file_path] = self.edit_file(lines, edit_fraction, boilerplate_density)
+            else:
+                second_files[self.create_file_path(files + index)] = self.create_file(line_count, boilerplate_density)
+
+        for name, repository_files in (('first', first_files), ('second', second_files)):
+            for file_path, lines in repository_files.items():
+                full_path = os.path.join(output_path, name, file_path)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                with open(full_path, 'w') as file:
+                    file.write('\n'.join(lines) + '\n')
+        return {
+            'files': files, 'lines_per_file': lines_per_file, 'duplicate_ratio': duplicate_ratio,
+            'partial_edit_rate': partial_edit_rate, 'boilerplate_density': boilerplate_density,
+            'edit_fraction': edit_fraction,
+            'first_lines': sum(len(lines) for lines in first_files.values()),
+            'second_lines': sum(len(lines) for lines in second_files.values()),
+        }
+
+
+def main(output_path: str, files: str = '1000', lines_per_file: str = '200', duplicate_ratio: str = '0.3',
+         partial_edit_rate: str = '0.4', boilerplate_density: str = '0.15'):
+    description = SyntheticRepositoryGenerator().generate(output_path, int(files), int(lines_per_file), float(duplicate_ratio),
+                                                          float(partial_edit_rate), float(boilerplate_density))
+    print(f'{description["files"]} files per repository, {description["first_lines"]} and {description["second_lines"]} '
+          f'lines written to {os.path.join(output_path, "first")} and {os.path.join(output_path, "second")}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,130 @@
+import contextlib
+import os
+import typing as t
+
+if t.TYPE_CHECKING:
+    from .results import ComparisonResult
+
+# the report formats, JSONL and PARQUET named like in export, which is not imported before a comparison runs
+MARKDOWN = 'markdown'
+CHARTS = 'png'
+JSONL = 'jsonl'
+PARQUET = 'parquet'
+REPORT_FORMATS = (MARKDOWN, CHARTS, JSONL, PARQUET)
+
+FINGERPRINT_CACHE_FILE = 'fingerprints.sqlite'
+INCREMENTAL_STATE_FILE = 'comparison_state.pickle'
+# keeps the fingerprint cache and the incremental state where they are configured in repo_comparison
+CONFIGURED = 'configured'
+
+
+@contextlib.contextmanager
+def configured(**settings) -> t.Iterator[None]:
+    """
+    Sets the module level settings of repo_comparison and comparator by name for the code run within and restores
+    them afterwards. Settings are global, two comparisons must not run at the same time in one process.
+    """
+    from . import comparator, repo_comparison
+
+    previous = []
+    try:
+        for name, value in settings.items():
+            module = next((module for module in (repo_comparison, comparator) if hasattr(module, name)), None)
+            if module is None:
+                raise ValueError(f"Unknown setting {name}")
+            previous.append((module, name, getattr(module, name)))
+            setattr(module, name, value)
+        yield
+    finally:
+        for module, name, value in reversed(previous):
+            setattr(module, name, value)
+
+
+def get_settings(report_directory: t.Optional[str], formats: t.Iterable[str], similarity_lower_bound: t.Optional[int],
+                 similarity_threshold: t.Optional[int], min_shared_lines: t.Optional[int], matching_mode: t.Optional[str],
+                 clone_min_lines: t.Optional[int], exclude: t.Iterable[str], respect_gitignore: bool,
+                 workers: t.Optional[int], readers: t.Optional[int], cache_directory: t.Optional[str]) -> dict:
+    """
+    Module level settings of a comparison, parameters left None keep the configured value.
+    Nothing is written without a report_directory.
+    """
+    formats = set(formats) if report_directory else set()
+    unknown_formats = formats - set(REPORT_FORMATS)
+    if unknown_formats:
+        raise ValueError(f"Unknown report formats {sorted(unknown_formats)}, expected any of {REPORT_FORMATS}")
+    settings = {
+        'markdown_reports': MARKDOWN in formats,
+        'plot_similarity_bar_charts': CHARTS in formats,
+        'structured_report_formats': [report_format for report_format in (JSONL, PARQUET) if report_format in formats],
+        'exclude_globs': list(exclude),
+        'respect_gitignore': respect_gitignore,
+    }
+    if report_directory:
+        settings['similarity_bar_chart_picture_directory'] = report_directory
+        settings['similarity_matrix_file'] = os.path.join(report_directory, 'similarity_matrix.md')
+    if cache_directory != CONFIGURED:
+        settings['fingerprint_cache_file'] = os.path.join(cache_directory, FINGERPRINT_CACHE_FILE) if cache_directory else None
+        settings['incremental_state_file'] = os.path.join(cache_directory, INCREMENTAL_STATE_FILE) if cache_directory else None
+    optional_settings = {
+        'similarity_lower_bound': similarity_lower_bound, 'similarity_threshold': similarity_threshold,
+        'min_shared_lines': min_shared_lines, 'matching_mode': matching_mode, 'clone_min_lines': clone_min_lines,
+        'ingestion_workers': workers, 'ingestion_readers': readers,
+    }
+    settings.update((name, value) for name, value in optional_settings.items() if value is not None)
+    return settings
+
+
+@contextlib.contextmanager
+def _running(report_directory: t.Optional[str], verbose: bool, progress: bool, phase_summary: bool,
+             settings: dict) -> t.Iterator[None]:
+    from . import instrumentation
+
+    if report_directory:
+        os.makedirs(report_directory, exist_ok=True)
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(configured(**settings))
+        # the phase summary is printed once the messages of the run are not silenced anymore
+        stack.enter_context(instrumentation.instrumented(phase_summary, progress))
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        yield
+
+
+def compare(first: str, second: str, report_directory: t.Optional[str] = None,
+            formats: t.Iterable[str] = (MARKDOWN, CHARTS), similarity_lower_bound: t.Optional[int] = None,
+            similarity_threshold: t.Optional[int] = None, min_shared_lines: t.Optional[int] = None,
+            matching_mode: t.Optional[str] = None, clone_min_lines: t.Optional[int] = None,
+            exclude: t.Iterable[str] = (), respect_gitignore: bool = True, workers: t.Optional[int] = None,
+            readers: t.Optional[int] = None, cache_directory: t.Optional[str] = CONFIGURED, verbose: bool = False,
+            progress: bool = False, phase_summary: bool = False) -> 'ComparisonResult':
+    """
+    Compares the folders first and second and returns what was found. The reports in formats are written into
+    report_directory, nothing is written without it. exclude are .gitignore style patterns of files left out below
+    both folders, like '*.min.js' or 'node_modules/', as are the files the .gitignore files ignore with
+    respect_gitignore. Fingerprints and scores of earlier runs are kept in cache_directory, None to keep none.
+    Parameters left None keep the values configured in repo_comparison and comparator. The messages of the run
+    are printed with verbose only.
+    """
+    settings = get_settings(report_directory, formats, similarity_lower_bound, similarity_threshold, min_shared_lines,
+                            matching_mode, clone_min_lines, exclude, respect_gitignore, workers, readers, cache_directory)
+    with _running(report_directory, verbose, progress, phase_summary, settings):
+        from . import repo_comparison
+        return repo_comparison.traverse_directories(first, second, report_directory)
+
+
+def compare_many(roots: dict[str, str], report_directory: t.Optional[str] = None,
+                 formats: t.Iterable[str] = (MARKDOWN, CHARTS), similarity_lower_bound: t.Optional[int] = None,
+                 similarity_threshold: t.Optional[int] = None, min_shared_lines: t.Optional[int] = None,
+                 matching_mode: t.Optional[str] = None, clone_min_lines: t.Optional[int] = None,
+                 exclude: t.Iterable[str] = (), respect_gitignore: bool = True, workers: t.Optional[int] = None,
+                 readers: t.Optional[int] = None, cache_directory: t.Optional[str] = CONFIGURED, verbose: bool = False,
+                 progress: bool = False, phase_summary: bool = False) -> dict[tuple[str, str], 'ComparisonResult']:
+    """
+    Compares every pair of the folders of roots, by name, like compare does for two of them. The reports of a pair
+    go into report_directory/<name>_<name>, the similarity matrix of all of them into report_directory.
+    """
+    settings = get_settings(report_directory, formats, similarity_lower_bound, similarity_threshold, min_shared_lines,
+                            matching_mode, clone_min_lines, exclude, respect_gitignore, workers, readers, cache_directory)
+    with _running(report_directory, verbose, progress, phase_summary, settings):
+        from . import repo_comparison
+        return repo_comparison.traverse_repositories(roots)
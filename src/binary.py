@@ -0,0 +1,124 @@
+import hashlib
+import io
+import typing as t
+
+import numpy as np
+
+TEXT = 'text'
+BINARY = 'binary'
+IMAGE = 'image'
+
+sniff_size = 8000  # like git, a file with a NUL byte among its first bytes is binary
+image_signatures = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a', b'\x00\x00\x01\x00', b'II*\x00', b'MM\x00*')
+# sizes of the DIB headers of the BMP versions, b'BM' alone starts too many text files
+_BMP_DIB_HEADER_SIZES = (12, 40, 52, 56, 64, 108, 124)
+
+# content defined chunks of binary files: a cut where the gear hash of the last 32 bytes has its top bits zero
+chunk_average_bits = 12  # 4 KiB average chunk size
+chunk_min_size = 1 << 10
+chunk_max_size = 1 << 15
+_GEAR = np.random.default_rng(0x6765617220).integers(0, 1 << 32, 256, dtype=np.uint64).astype(np.uint32)
+
+perceptual_hash_size = 8  # rows and columns of the difference hash, 64 bits
+
+
+def is_bmp_header(head: bytes, size: t.Optional[int] = None) -> bool:
+    """
+    Whether head starts with a BMP file header followed by a known DIB header, of a file of size bytes if given.
+    """
+    if len(head) < 18 or not head.startswith(b'BM'):
+        return False
+    file_size, pixel_offset, dib_header_size = (int.from_bytes(head[start:start + 4], 'little') for start in (2, 10, 14))
+    return dib_header_size in _BMP_DIB_HEADER_SIZES and pixel_offset >= 14 + dib_header_size \
+        and (size is None or file_size == size)
+
+
+def sniff_file_kind(head: bytes, size: t.Optional[int] = None) -> str:
+    """
+    Kind of a file from its first bytes, and its size if known, to check the header of a BMP against.
+    """
+    if head.startswith(image_signatures) or (head[:4] == b'RIFF' and head[8:12] == b'WEBP') or is_bmp_header(head, size):
+        return IMAGE
+    return get_content_kind(head)
+
+
+def get_content_kind(head: bytes) -> str:
+    return BINARY if b'\x00' in head[:sniff_size] else TEXT
+
+
+def get_chunk_cuts(buffer: bytes, final: bool = True) -> list[int]:
+    """
+    End offsets of the content defined chunks of the buffer. Unless final, the buffer is a block of a longer stream
+    starting at a cut and the bytes after the last cut are left for the next block. A stream split at the returned
+    cuts gets the same chunks as the whole file in one buffer: chunk_min_size is longer than the 32 byte gear window.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    gear = _GEAR[data]
+    # the 32 bit gear hash h = (h << 1) + gear[byte] only depends on the last 32 bytes, so all of them add up at once
+    rolling = np.zeros(len(data), dtype=np.uint32)
+    for shift in range(min(32, len(data))):
+        rolling[shift:] += gear[:len(data) - shift] << np.uint32(shift)
+    candidate_cuts = np.flatnonzero((rolling >> np.uint32(32 - chunk_average_bits)) == 0) + 1
+
+    cuts = []
+    start = 0
+    for cut in candidate_cuts.tolist():
+        while cut - start > chunk_max_size:
+            start += chunk_max_size
+            cuts.append(start)
+        if cut - start >= chunk_min_size:
+            cuts.append(cut)
+            start = cut
+    while len(data) - start > chunk_max_size:
+        start += chunk_max_size
+        cuts.append(start)
+    if final and start < len(data):
+        cuts.append(len(data))
+    return cuts
+
+
+def get_chunk_hashes(buffer: bytes, cuts: t.Optional[list[int]] = None) -> np.ndarray:
+    """
+    Splits the buffer into content defined chunks and returns their 64 bit hashes in order. An insertion or
+    deletion only changes the chunks around it, so two versions of a binary share most of their chunk hashes.
+    """
+    if cuts is None:
+        cuts = get_chunk_cuts(buffer)
+    starts = [0] + cuts[:-1]
+    with memoryview(buffer) as view:
+        return np.frombuffer(b''.join(hashlib.blake2b(view[chunk_start:chunk_end], digest_size=8).digest()
+                                      for chunk_start, chunk_end in zip(starts, cuts)), dtype=np.int64)
+
+
+def get_perceptual_hash(buffer: bytes) -> t.Optional[int]:
+    """
+    64 bit difference hash of an image: it is decoded at a reduced size where the format allows it, put on a white
+    background, scaled down to 9x8 grey pixels, and every bit tells whether a pixel is brighter than its left neighbour.
+    Returns None if pillow is not installed or the image can not be decoded.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(buffer)) as image:
+            image.draft('RGB', (perceptual_hash_size * 8, perceptual_hash_size * 8))
+            image.thumbnail((perceptual_hash_size * 16, perceptual_hash_size * 16))
+            image = image.convert('RGBA')
+            background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+            background.alpha_composite(image)
+            pixels = np.asarray(background.convert('L').resize((perceptual_hash_size + 1, perceptual_hash_size),
+                                                               Image.BILINEAR), dtype=np.int16)
+    except Exception:
+        # pillow raises anything from OSError to SyntaxError on broken or unsupported images
+        return None
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>i8')[0])
+
+
+def get_hamming_distances(perceptual_hash: int, perceptual_hashes: np.ndarray) -> np.ndarray:
+    """
+    Number of differing bits between perceptual_hash and each of the int64 perceptual_hashes.
+    """
+    differences = np.bitwise_xor(perceptual_hashes, np.int64(perceptual_hash))
+    return np.unpackbits(differences.view(np.uint8)).reshape(len(differences), 64).sum(axis=1)
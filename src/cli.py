@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import sys
+
+from . import api
+
+
+def get_names(roots: list[str]) -> list[str]:
+    names = [os.path.basename(os.path.normpath(root)) or root for root in roots]
+    # folders of the same name in different places are told apart by their position
+    return [f'{name}_{i}' if names.count(name) > 1 else name for i, name in enumerate(names)]
+
+
+def format_result(result, threshold: int) -> str:
+    identical_count = result.similarities.count_at_least(100)
+    return f'{result.first} <> {result.second}: {identical_count} identical and ' \
+           f'{len(result.matched_pairs) - identical_count} partially duplicated pairs, {len(result.unique_first)} and ' \
+           f'{len(result.unique_second)} unique files, {result.get_share_above(threshold):.1f}% of the files more than ' \
+           f'{threshold}% similar, {result.mean_similarity:.1f}% mean similarity'
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m src', description='Find duplicated and similar files of two or more folders')
+    parser.add_argument('roots', nargs='+', metavar='FOLDER', help='folders to compare, every pair of them with more than two')
+    parser.add_argument('--report-directory', help='folder to write the reports into, none are written otherwise')
+    parser.add_argument('--formats', nargs='+', choices=api.REPORT_FORMATS, default=[api.MARKDOWN, api.CHARTS],
+                        help='reports to write into the report directory')
+    parser.add_argument('--exclude', action='append', default=[], metavar='GLOB',
+                        help='.gitignore style pattern of files to leave out, like "*.min.js" or "node_modules/", repeatable')
+    parser.add_argument('--no-gitignore', action='store_true', help='also compare the files ignored by .gitignore files')
+    parser.add_argument('--lower-bound', type=int, help='similarity in percent below which files are not matched')
+    parser.add_argument('--threshold', type=int, default=50, help='the share of files more similar than this is printed')
+    parser.add_argument('--min-shared-lines', type=int, help='pairs sharing fewer distinct lines are not compared')
+    parser.add_argument('--matching', choices=['mutual_best', 'optimal'], help='how matched pairs are chosen')
+    parser.add_argument('--clone-min-lines', type=int, help='shortest copied block reported, 0 to find none')
+    parser.add_argument('--workers', type=int, help='processes hashing files, 1 to hash in this process')
+    parser.add_argument('--readers', type=int, help='threads reading files')
+    parser.add_argument('--cache-directory', default='./cache', help='folder of the fingerprint cache and incremental state')
+    parser.add_argument('--no-cache', action='store_true', help='hash every file and score every pair again')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='print the messages of the run')
+    parser.add_argument('--progress', action='store_true', help='show the progress of the long phases on stderr')
+    parser.add_argument('--phase-summary', action='store_true', help='print the time spent in every phase at the end')
+    return parser
+
+
+def main(arguments: list[str] = None) -> int:
+    parser = create_parser()
+    options = parser.parse_args(arguments)
+    if len(options.roots) < 2:
+        parser.error('at least two folders are needed')
+
+    settings = dict(
+        report_directory=options.report_directory, formats=options.formats, similarity_lower_bound=options.lower_bound,
+        similarity_threshold=options.threshold, min_shared_lines=options.min_shared_lines, matching_mode=options.matching,
+        clone_min_lines=options.clone_min_lines, exclude=options.exclude, respect_gitignore=not options.no_gitignore,
+        workers=options.workers, readers=options.readers, cache_directory=None if options.no_cache else options.cache_directory,
+        verbose=options.verbose, progress=options.progress, phase_summary=options.phase_summary,
+    )
+    try:
+        if len(options.roots) == 2:
+            results = [api.compare(*options.roots, **settings)]
+        else:
+            results = list(api.compare_many(dict(zip(get_names(options.roots), options.roots)), **settings).values())
+    except (FileNotFoundError, NotADirectoryError) as error:
+        parser.error(str(error))
+
+    if options.json:
+        print(json.dumps([result.as_dict() for result in results], indent=2))
+    else:
+        for result in results:
+            print(format_result(result, options.threshold))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import numpy as np
+
+from .binary import TEXT
+from .comparator import FileMeta
+
+# multiplier of the polynomial window hash, odd so that it is invertible modulo 2 ** 64
+_WINDOW_BASE = np.uint64(0x100000001B3)
+
+
+class CloneBlock:
+    """
+    A maximal run of at least min_lines consecutive non-empty lines shared by two files, as line number ranges.
+    """
+    __slots__ = ('first_file_meta', 'second_file_meta', 'first_start_line', 'first_end_line',
+                 'second_start_line', 'second_end_line', 'line_count')
+
+    def __init__(self, first_file_meta: FileMeta, second_file_meta: FileMeta, first_start_line: int, first_end_line: int,
+                 second_start_line: int, second_end_line: int, line_count: int):
+        self.first_file_meta = first_file_meta
+        self.second_file_meta = second_file_meta
+        self.first_start_line = first_start_line
+        self.first_end_line = first_end_line
+        self.second_start_line = second_start_line
+        self.second_end_line = second_end_line
+        self.line_count = line_count
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}( {self.line_count} lines, {self.first_file_meta.file_path} " \
+               f"{self.first_start_line}-{self.first_end_line} <> {self.second_file_meta.file_path} " \
+               f"{self.second_start_line}-{self.second_end_line} )"
+
+
+class CloneDetector:
+    """
+    Finds copied or moved blocks of consecutive lines between two trees, independent of which files are matched.
+    All files of both trees are searched, pairs of identical files themselves are skipped.
+
+    Every window of min_lines consecutive non-empty lines gets a Rabin-Karp polynomial hash of its line hashes.
+    The windows of all files of a side go into one global index, equal windows of both sides are joined through a
+    sort and a binary search, and matching windows on the same diagonal of a file pair are merged into maximal blocks.
+    Everything is vectorized, O(L log L) for L lines of both trees plus the number of matching windows. Windows
+    occurring more than max_window_occurrences times on a side (boilerplate) are ignored to keep that number bounded.
+    """
+
+    def __init__(self, min_lines: int = 5, max_window_occurrences: int = 100):
+        self.min_lines = min_lines
+        self.max_window_occurrences = max_window_occurrences
+
+    def get_window_hashes(self, line_hashes: np.ndarray) -> np.ndarray:
+        window_count = len(line_hashes) - self.min_lines + 1
+        if window_count <= 0:
+            return np.empty(0, dtype=np.uint64)
+        values = line_hashes.view(np.uint64)
+        window_hashes = np.zeros(window_count, dtype=np.uint64)
+        for offset in range(self.min_lines):
+            window_hashes *= _WINDOW_BASE
+            window_hashes += values[offset:offset + window_count]
+        return window_hashes
+
+    def create_index(self, file_metas: list[FileMeta]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Window hashes of all text files with the file index and the position of the window's first line in the file.
+        """
+        window_hashes = [self.get_window_hashes(file_meta.line_hashes if file_meta.kind == TEXT else file_meta.line_hashes[:0])
+                         for file_meta in file_metas]
+        sizes = [len(hashes) for hashes in window_hashes]
+        if not sum(sizes):
+            return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        hashes = np.concatenate(window_hashes)
+        file_ids = np.repeat(np.arange(len(file_metas)), sizes)
+        positions = np.arange(len(hashes)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+        _, inverse, counts = np.unique(hashes, return_inverse=True, return_counts=True)
+        frequent = counts[inverse] > self.max_window_occurrences
+        return hashes[~frequent], file_ids[~frequent], positions[~frequent]
+
+    def find_blocks(self, first_file_metas: list[FileMeta], second_file_metas: list[FileMeta]) -> list[CloneBlock]:
+        first_hashes, first_ids, first_positions = self.create_index(first_file_metas)
+        second_hashes, second_ids, second_positions = self.create_index(second_file_metas)
+
+        # join equal windows: each second window against the range of equal first windows
+        order = np.argsort(first_hashes, kind='stable')
+        sorted_first_hashes = first_hashes[order]
+        low = np.searchsorted(sorted_first_hashes, second_hashes, side='left')
+        counts = np.searchsorted(sorted_first_hashes, second_hashes, side='right') - low
+        second_windows = np.repeat(np.arange(len(second_hashes)), counts)
+        offsets = np.arange(len(second_windows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        first_windows = order[np.repeat(low, counts) + offsets]
+        if not len(first_windows):
+            return []
+
+        first_file = first_ids[first_windows]
+        second_file = second_ids[second_windows]
+        # identical files share all their lines, only copies between files of different content are blocks
+        hash_ids = {}
+        first_hash_ids = np.array([hash_ids.setdefault(file_meta.file_hash, len(hash_ids)) for file_meta in first_file_metas])
+        second_hash_ids = np.array([hash_ids.setdefault(file_meta.file_hash, len(hash_ids)) for file_meta in second_file_metas])
+        different = first_hash_ids[first_file] != second_hash_ids[second_file]
+        first_windows, second_windows = first_windows[different], second_windows[different]
+        first_file, second_file = first_file[different], second_file[different]
+        if not len(first_windows):
+            return []
+        first_position = first_positions[first_windows]
+        second_position = second_positions[second_windows]
+        diagonal = first_position - second_position
+
+        # windows following each other on the same diagonal of the same file pair form one block
+        order = np.lexsort((first_position, diagonal, second_file, first_file))
+        first_file, second_file, first_position, second_position, diagonal = \
+            first_file[order], second_file[order], first_position[order], second_position[order], diagonal[order]
+        continues = np.zeros(len(order), dtype=bool)
+        continues[1:] = (first_file[1:] == first_file[:-1]) & (second_file[1:] == second_file[:-1]) \
+            & (diagonal[1:] == diagonal[:-1]) & (first_position[1:] == first_position[:-1] + 1)
+        starts = np.flatnonzero(~continues)
+        window_counts = np.diff(np.append(starts, len(order)))
+
+        blocks = []
+        for start, window_count in zip(starts.tolist(), window_counts.tolist()):
+            first_file_meta = first_file_metas[first_file[start]]
+            second_file_meta = second_file_metas[second_file[start]]
+            line_count = window_count + self.min_lines - 1
+            first_start = int(first_position[start])
+            second_start = int(second_position[start])
+            blocks.append(CloneBlock(
+                first_file_meta, second_file_meta,
+                int(first_file_meta.line_nrs[first_start]), int(first_file_meta.line_nrs[first_start + line_count - 1]),
+                int(second_file_meta.line_nrs[second_start]), int(second_file_meta.line_nrs[second_start + line_count - 1]),
+                line_count
+            ))
+        return blocks
@@ -4,24 +4,101 @@ import hashlib
 from pathlib import Path
 import typing as t
 from collections import defaultdict
+from itertools import islice
+
+import numpy as np
+
+from . import instrumentation
+from .binary import (BINARY, IMAGE, TEXT, get_chunk_cuts, get_chunk_hashes, get_hamming_distances, get_perceptual_hash,
+                     get_content_kind, sniff_file_kind, sniff_size)
+from .fingerprint import BLAKE2B, default_boilerplate_patterns, get_bytes_hasher, get_line_hasher, normalize_lines
+from .ignore import GIT_DIRECTORY, GITIGNORE, IgnorePatterns, is_ignored
+
+if t.TYPE_CHECKING:
+    from .clones import CloneBlock
+    from .fingerprint_cache import FingerprintCache
 
 exclude_files_from_comparison = ['package-lock.json']
+exclude_globs: list[str] = []  # .gitignore style patterns below the compared folder, like '*.min.js' or 'docs/'
+respect_gitignore = False  # also leave out what the .gitignore files below the compared folder ignore
+ingestion_workers = None  # processes hashing files, None for one per cpu, 1 to stay in the current process
+ingestion_readers = 8  # threads reading files, more of them hide more latency of network file systems
+ingestion_max_queued_files = 256  # files waiting between two ingestion stages before the earlier stage blocks
+ingestion_max_queued_bytes = 256 << 20  # bytes of read files waiting to be hashed before the readers block
+stream_file_size = 64 << 20  # larger files are fingerprinted in blocks of stream_block_size instead of all at once
+stream_block_size = 8 << 20
+line_hash_algorithm = BLAKE2B  # or SHA256, or XXHASH with the xxhash package installed
+line_normalization: list[str] = []  # any of STRIP_COMMENTS, COLLAPSE_WHITESPACE, SKIP_BOILERPLATE
+boilerplate_patterns: list[str] = list(default_boilerplate_patterns)  # regular expressions of whole lines
+perceptual_image_matching = False  # compare images by a perceptual hash, needs pillow, by their bytes like binaries otherwise
+perceptual_hash_max_distance = 10  # differing bits of the 64 bit perceptual hashes of two 0% similar images
+
+# (line hash algorithm, normalization passes, boilerplate patterns, perceptual image matching), everything a
+# FileFingerprint depends on
+FingerprintSettings = tuple[str, tuple[str, ...], tuple[str, ...], bool]
+
+# (file hash, line numbers, 64 bit line hashes, TEXT / BINARY / IMAGE, perceptual hash of an image) of a file,
+# cheap to send back from a worker process. Binary files have content defined chunks instead of lines.
+FileFingerprint = tuple[str, np.ndarray, np.ndarray, str, t.Optional[int]]
+
+# ASCII characters str.strip removes and bytes.strip does not
+_ASCII_SEPARATORS = (b'\x1c', b'\x1d', b'\x1e', b'\x1f')
+# lines hashed at once when a file is read in blocks
+_STREAM_LINE_BATCH = 1 << 16
+
 
 class LineMeta:
-    def __init__(self, file_path: str, line_nr: int, content: str, content_hash: str):
-        self.file_path = file_path
+    """
+    View of a single line of a FileMeta, the content is read from the file when it is accessed for the first time.
+    """
+    __slots__ = ('file_meta', 'line_nr', 'content_hash')
+
+    def __init__(self, file_meta: 'FileMeta', line_nr: int, content_hash: int):
+        self.file_meta = file_meta
         self.line_nr = line_nr
-        self.content = content
         self.content_hash = content_hash
 
+    @property
+    def file_path(self) -> str:
+        return self.file_meta.file_path
+
+    @property
+    def content(self) -> str:
+        return self.file_meta.get_line_content(self.line_nr)
+
 
 class FileMeta:
-    def __init__(self, file_path: str, file_hash: str, line_metas: list[LineMeta]):
+    """
+    Line numbers and 64 bit line hashes of the non-empty lines are kept in arrays,
+    line_metas and hash_multi_map are created from them on access.
+    The lines of a binary file are its content defined chunks, numbered in order, an image has a perceptual hash instead.
+    """
+    __slots__ = ('file_path', 'file_name', 'file_hash', 'line_nrs', 'line_hashes', 'kind', 'perceptual_hash',
+                 '_line_contents', '_hash_counts')
+
+    def __init__(self, file_path: str, file_hash: str, line_nrs: np.ndarray, line_hashes: np.ndarray, kind: str = TEXT,
+                 perceptual_hash: t.Optional[int] = None):
         self.file_path = file_path
         self.file_name = Path(file_path).name
         self.file_hash = file_hash
-        self.line_metas = line_metas
-        self.hash_multi_map = self.create_hash_multi_map(line_metas)
+        self.line_nrs = line_nrs
+        self.line_hashes = line_hashes
+        self.kind = kind
+        self.perceptual_hash = perceptual_hash
+        self._line_contents: t.Optional[list[str]] = None
+        self._hash_counts: t.Optional[tuple[np.ndarray, np.ndarray]] = None
+
+    @property
+    def line_metas(self) -> list[LineMeta]:
+        return [LineMeta(self, line_nr, line_hash) for line_nr, line_hash in zip(self.line_nrs.tolist(), self.line_hashes.tolist())]
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_hashes)
+
+    @property
+    def hash_multi_map(self) -> dict[int, list[LineMeta]]:
+        return self.create_hash_multi_map(self.line_metas)
 
     @staticmethod
     def create_hash_multi_map(line_hashes):
@@ -31,13 +108,31 @@ class FileMeta:
         return hash_multi_map
 
     def get_lines_hashes_set(self):
-        return set(self.hash_multi_map.keys())
+        return set(self.line_hashes.tolist())
+
+    def get_hash_counts(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Sorted distinct line hashes and how often each of them occurs.
+        """
+        if self._hash_counts is None:
+            self._hash_counts = np.unique(self.line_hashes, return_counts=True)
+        return self._hash_counts
+
+    def get_line_content(self, line_nr: int) -> str:
+        if self.kind != TEXT:
+            return f'<{self.kind} chunk {line_nr}>'
+        if self._line_contents is None:
+            self._line_contents = Comparator.read_purified_lines(self.file_path)
+        return self._line_contents[line_nr]
+
+    def release_line_contents(self):
+        self._line_contents = None
 
     def is_picture(self):
-        return self.file_name.endswith('.png') or self.file_name.endswith('.ico')
+        return self.kind == IMAGE
 
     def __repr__(self):
-        return f"{self.__class__.__name__}( {self.file_hash}, {len(self.line_metas)} lines, \t{self.file_path} )"
+        return f"{self.__class__.__name__}( {self.file_hash}, {self.line_count} lines, \t{self.file_path} )"
 
 
 class FileComparison:
@@ -49,6 +144,7 @@ class FileComparison:
         self.duplicate_lines: list[LineMeta] = []
         self.unique_in_first: list[LineMeta] = []
         self.unique_in_second: list[LineMeta] = []
+        self.copied_blocks: list['CloneBlock'] = []  # blocks of consecutive lines shared by both files
 
     def __repr__(self):
         return f"{self.__class__.__name__}( similarity {self.get_similarity()}%, {self.first_file_meta.file_path} <> {self.second_file_meta.file_path} )"
@@ -56,6 +152,14 @@ class FileComparison:
     def get_similarity(self):
         return 100 - self.uniqueness_score
 
+    def release_lines(self):
+        self.duplicate_lines = []
+        self.unique_in_first = []
+        self.unique_in_second = []
+        self.copied_blocks = []
+        self.first_file_meta.release_line_contents()
+        self.second_file_meta.release_line_contents()
+
 
 class Comparator:
 
@@ -88,115 +192,359 @@ class Comparator:
         hasher.update(line.encode('utf-8'))
         return hasher.hexdigest()
 
+    @staticmethod
+    def calculate_line_hashes(lines: list[str], algorithm: t.Optional[str] = None) -> np.ndarray:
+        """
+        Calculate the 64 bit integer hashes of lines with algorithm, line_hash_algorithm by default,
+        SHA-256 ones are truncated.
+        """
+        return get_line_hasher(algorithm or line_hash_algorithm)(lines)
+
+    @staticmethod
+    def get_fingerprint_settings() -> FingerprintSettings:
+        return line_hash_algorithm, tuple(line_normalization), tuple(boilerplate_patterns), perceptual_image_matching
+
+    @staticmethod
+    def split_purified_lines(buffer: bytes) -> list[str]:
+        """
+        Split the file content the same way reading the file in text mode does, with every line stripped.
+        """
+        text = buffer.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+        return [line.strip() for line in text.split('\n')]
+
+    @staticmethod
+    def split_purified_line_bytes(buffer: bytes) -> list[bytes]:
+        """
+        The lines of split_purified_lines encoded as UTF-8, to be hashed. ASCII text, most source code, is split and
+        stripped on its bytes without being decoded, other text is decoded to be stripped the way str.strip does.
+        """
+        if not buffer.isascii() or any(separator in buffer for separator in _ASCII_SEPARATORS):
+            return [line.encode('utf-8') for line in Comparator.split_purified_lines(buffer)]
+        if b'\r' in buffer:
+            buffer = buffer.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        return [line.strip() for line in buffer.split(b'\n')]
+
+    @staticmethod
+    def split_purified_line_blocks(blocks: t.Iterable[bytes],
+                                   split: t.Callable[[bytes], list] = split_purified_lines) -> t.Iterator:
+        """
+        Split the content read in blocks with split_purified_lines or split_purified_line_bytes, every block up to
+        its last line break, so that no line and no UTF-8 character is cut.
+        """
+        rest = b''
+        for block in blocks:
+            buffer = rest + block
+            # a \r at the end might be followed by the \n of the next block
+            end = max(buffer.rfind(b'\n'), buffer.rfind(b'\r', 0, len(buffer) - 1)) + 1
+            yield from split(buffer[:end])[:-1]
+            rest = buffer[end:]
+        yield from split(rest)
+
+    @staticmethod
+    def read_file_blocks(file, file_hasher, block_size: int) -> t.Iterator[bytes]:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                return
+            file_hasher.update(block)
+            yield block
+
+    @staticmethod
+    def read_purified_lines(file_path) -> list[str]:
+        with open(file_path, 'rb') as file:
+            return list(Comparator.split_purified_line_blocks(iter(lambda: file.read(stream_block_size), b'')))
+
     @staticmethod
     def get_line_metas_for_file(file_path) -> list[LineMeta]:
-        meta = list()
+        return Comparator.get_file_meta(file_path).line_metas
 
-        # TODO deal with pictures
-        if '.png' in file_path or '.ico' in file_path:
-            return list()
+    @staticmethod
+    def fingerprint_file(file_path, settings: t.Optional[FingerprintSettings] = None) -> FileFingerprint:
+        """
+        Read the file once and calculate the SHA-256 hash of the file and the hash of each line left non-empty by
+        the normalization passes from the same buffer, files larger than stream_file_size are read in blocks.
+        With perceptual_image_matching, images, recognized by their first bytes, get a perceptual hash. Other
+        binaries, and text which is not valid UTF-8, get the hashes of their content defined chunks; so do images
+        without perceptual_image_matching and images pillow can not decode.
+        """
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size > stream_file_size:
+                return Comparator.fingerprint_stream(file_path, file, settings)
+            buffer = file.read()
+        return Comparator.fingerprint_buffer(file_path, buffer, settings)
 
-        with open(file_path, 'r') as file:
-            for line_nr, line in enumerate(file.readlines()):
-                # todo empty lines and comments
-                purified = line.strip()
-                if purified:
-                    line = purified
-                    meta.append(LineMeta(file_path, line_nr, line, Comparator.calculate_hash_from_string(line)))
+    @staticmethod
+    def fingerprint_stream(file_path, file, settings: t.Optional[FingerprintSettings] = None,
+                           block_size: t.Optional[int] = None) -> FileFingerprint:
+        """
+        Fingerprint an open file in blocks of stream_block_size, so that memory stays bounded by the block size and
+        the longest line: every block of text is split up to its last line break and every block of a binary up to its
+        last chunk cut, the rest is carried over to the next block. The fingerprint is the one of fingerprint_buffer,
+        except that images are taken as binaries. Text found not to be valid UTF-8 is read again as a binary.
+        """
+        algorithm, passes, patterns, _ = settings or Comparator.get_fingerprint_settings()
+        block_size = block_size or stream_block_size
+        file.seek(0)
+        if sniff_file_kind(file.read(sniff_size)) == TEXT:
+            file.seek(0)
+            file_hasher = hashlib.sha256()
+            blocks = Comparator.read_file_blocks(file, file_hasher, block_size)
+            if passes:
+                lines = normalize_lines(Comparator.split_purified_line_blocks(blocks), file_path, passes, patterns)
+                hash_lines = get_line_hasher(algorithm)
+            else:
+                lines = Comparator.split_purified_line_blocks(blocks, Comparator.split_purified_line_bytes)
+                hash_lines = get_bytes_hasher(algorithm)
+            line_nrs, line_hashes = [], []
+            line_count = 0
+            try:
+                for batch in iter(lambda: list(islice(lines, _STREAM_LINE_BATCH)), []):
+                    batch_line_nrs, batch_line_hashes = Comparator.hash_non_empty_lines(batch, hash_lines)
+                    line_nrs.append(batch_line_nrs + line_count)
+                    line_hashes.append(batch_line_hashes)
+                    line_count += len(batch)
+                return file_hasher.hexdigest(), np.concatenate(line_nrs), np.concatenate(line_hashes), TEXT, None
+            except UnicodeDecodeError:
+                pass
+
+        file.seek(0)
+        file_hasher = hashlib.sha256()
+        chunk_hashes = []
+        rest = b''
+        for block in Comparator.read_file_blocks(file, file_hasher, block_size):
+            buffer = rest + block
+            cuts = get_chunk_cuts(buffer, final=False)
+            chunk_hashes.append(get_chunk_hashes(buffer, cuts))
+            rest = buffer[cuts[-1]:] if cuts else buffer
+        chunk_hashes.append(get_chunk_hashes(rest))
+        chunk_hashes = np.concatenate(chunk_hashes)
+        return file_hasher.hexdigest(), np.arange(len(chunk_hashes), dtype=np.int32), chunk_hashes, BINARY, None
 
-        return meta
+    @staticmethod
+    def hash_non_empty_lines(lines: list, hash_lines: t.Callable[[t.Iterable], np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        line_nrs = np.array([line_nr for line_nr, line in enumerate(lines) if line], dtype=np.int32)
+        return line_nrs, hash_lines(filter(None, lines))
+
+    @staticmethod
+    def fingerprint_buffer(file_path, buffer: bytes, settings: t.Optional[FingerprintSettings] = None) -> FileFingerprint:
+        algorithm, passes, patterns, perceptual_images = settings or Comparator.get_fingerprint_settings()
+        file_hash = hashlib.sha256(buffer).hexdigest()
+
+        kind = sniff_file_kind(buffer, len(buffer))
+        if kind == IMAGE:
+            perceptual_hash = get_perceptual_hash(buffer) if perceptual_images else None
+            if perceptual_hash is not None:
+                return file_hash, np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64), IMAGE, perceptual_hash
+            # compared by content, or an image signature at the start of a file which is not an image after all
+            kind = get_content_kind(buffer)
+        if kind == TEXT:
+            try:
+                if passes:
+                    lines = list(normalize_lines(Comparator.split_purified_lines(buffer), file_path, passes, patterns))
+                    line_nrs, line_hashes = Comparator.hash_non_empty_lines(lines, get_line_hasher(algorithm))
+                else:
+                    line_nrs, line_hashes = Comparator.hash_non_empty_lines(
+                        Comparator.split_purified_line_bytes(buffer), get_bytes_hasher(algorithm))
+                return file_hash, line_nrs, line_hashes, TEXT, None
+            except UnicodeDecodeError:
+                pass
+        chunk_hashes = get_chunk_hashes(buffer)
+        return file_hash, np.arange(len(chunk_hashes), dtype=np.int32), chunk_hashes, BINARY, None
+
+    @staticmethod
+    def create_file_meta_from_fingerprint(file_path, fingerprint: FileFingerprint) -> FileMeta:
+        return FileMeta(file_path, *fingerprint)
 
     @staticmethod
     def get_file_meta(file_path) -> FileMeta:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File {file_path} does not exist")
-        return FileMeta(file_path, Comparator.calculate_hash_from_path(file_path), Comparator.get_line_metas_for_file(file_path))
+        return Comparator.create_file_meta_from_fingerprint(file_path, Comparator.fingerprint_file(file_path))
+
+    @staticmethod
+    def get_file_paths_for_folder(folder_path) -> list[str]:
+        if not os.path.exists(folder_path):
+            raise FileNotFoundError(f"Path {folder_path} does not exist")
+        if not os.path.isdir(folder_path):
+            raise NotADirectoryError(f"Path {folder_path} is not a directory")
+        return list(Comparator.iterate_file_paths(folder_path))
 
     @staticmethod
-    def create_file_metas_for_folder(folder_path) -> list[FileMeta]:
+    def iterate_file_paths(folder_path) -> t.Iterator[str]:
+        """
+        The files below folder_path in the order of os.walk, one os.scandir per directory. Like os.walk, directories
+        which can not be listed are skipped and symbolic links to directories are not followed.
+        Files and directories matched by exclude_globs or, with respect_gitignore, by a .gitignore are left out,
+        as is every .git with respect_gitignore.
+        """
+        # exclude_globs outrank the .gitignore files, like patterns given to git on the command line
+        ignore_patterns = [IgnorePatterns(exclude_globs, folder_path)] if exclude_globs else []
+        # every directory with the .gitignore patterns of its parents, the innermost last
+        directories = [(folder_path, [])]
+        while directories:
+            directory, gitignore_patterns = directories.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+            if respect_gitignore and any(entry.name == GITIGNORE for entry in entries):
+                gitignore_patterns = gitignore_patterns + [IgnorePatterns.from_file(os.path.join(directory, GITIGNORE))]
+            applied_patterns = gitignore_patterns + ignore_patterns
+            sub_directories = []
+            for entry in entries:
+                if respect_gitignore and entry.name == GIT_DIRECTORY:
+                    continue
+                try:
+                    is_directory = entry.is_dir()
+                except OSError:
+                    is_directory = False
+                if applied_patterns and is_ignored(entry.path, is_directory, applied_patterns):
+                    continue
+                if is_directory:
+                    if not entry.is_symlink():
+                        sub_directories.append((entry.path, gitignore_patterns))
+                elif entry.name not in exclude_files_from_comparison:
+                    yield entry.path
+            directories.extend(reversed(sub_directories))
+
+    @staticmethod
+    def create_file_metas_for_folder(folder_path, workers: t.Optional[int] = None, cache: 'FingerprintCache' = None) -> list[FileMeta]:
+        from .ingestion import IngestionPipeline
+
         if not os.path.exists(folder_path):
             raise FileNotFoundError(f"Path {folder_path} does not exist")
         if not os.path.isdir(folder_path):
             raise NotADirectoryError(f"Path {folder_path} is not a directory")
-        file_metas = []
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_name = Path(file_path).name
-                if file_name not in exclude_files_from_comparison:
-                    file_metas.append(Comparator.get_file_meta(file_path))
+        pipeline = IngestionPipeline(ingestion_readers, workers or ingestion_workers or os.cpu_count() or 1,
+                                     ingestion_max_queued_files, ingestion_max_queued_bytes, Comparator.get_fingerprint_settings(),
+                                     stream_file_size)
+        with instrumentation.phase('fingerprinting', folder=str(folder_path)):
+            file_paths, fingerprints = pipeline.run(folder_path, cache)
+        # the statistics of the stages are shown with the other instrumentation only
+        if instrumentation.get_active():
+            print(pipeline.get_statistics())
+        if cache:
+            cache.evict_missing(folder_path, file_paths)
+
+        file_metas = [Comparator.create_file_meta_from_fingerprint(file_path, fingerprints[file_path]) for file_path in file_paths]
+        instrumentation.count('files', len(file_metas))
+        instrumentation.count('lines', sum(file_meta.line_count for file_meta in file_metas))
         return file_metas
 
     @staticmethod
-    def compare_two_file_metas(first_file_meta: FileMeta, second_file_meta: FileMeta) -> FileComparison:
+    def is_identical(first_file_meta: FileMeta, second_file_meta: FileMeta) -> bool:
+        return first_file_meta.file_hash == second_file_meta.file_hash
 
-        if first_file_meta.is_picture() and second_file_meta.is_picture():
-            if first_file_meta.file_name == second_file_meta.file_name:
-            # TODO make an actual picture comparison
-            # Right now picture are compared only by file name
-                return FileComparison(first_file_meta, second_file_meta, 0)
+    @staticmethod
+    def get_picture_uniqueness_scores(perceptual_hash: int, perceptual_hashes: np.ndarray) -> np.ndarray:
+        """
+        Uniqueness scores of an image against images with the given perceptual hashes, from the share of differing
+        bits up to perceptual_hash_max_distance.
+        """
+        distances = get_hamming_distances(perceptual_hash, perceptual_hashes)
+        return np.minimum(np.rint(distances * 100 / perceptual_hash_max_distance), 100).astype(np.int64)
 
-        if first_file_meta.file_hash == second_file_meta.file_hash:
-            return FileComparison(first_file_meta, second_file_meta, 0)
+    @staticmethod
+    def get_uniqueness_scores(file_meta: FileMeta, candidates: list[FileMeta]) -> np.ndarray:
+        """
+        Uniqueness scores of file_meta against each of the candidates, the same scores compare_two_file_metas computes.
+        The line multisets of all candidates are intersected with the one of file_meta in a single vectorized pass.
+        Per hash shared a and b times, min(a, b) lines are duplicates and the b - a surplus of the candidate is unique,
+        a surplus of file_meta is counted neither way. Images are scored by their perceptual hashes.
+        """
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+        unique_hashes, hash_counts = file_meta.get_hash_counts()
+        candidate_hash_counts = [candidate.get_hash_counts() for candidate in candidates]
+        candidate_hashes = np.concatenate([hashes for hashes, _ in candidate_hash_counts])
+        candidate_counts = np.concatenate([counts for _, counts in candidate_hash_counts])
+        candidate_ids = np.repeat(np.arange(len(candidates)), [len(hashes) for hashes, _ in candidate_hash_counts])
+
+        positions = np.searchsorted(unique_hashes, candidate_hashes)
+        positions[positions == len(unique_hashes)] = 0
+        shared = unique_hashes[positions] == candidate_hashes if len(unique_hashes) else np.zeros(len(candidate_hashes), dtype=bool)
+        first_counts = hash_counts[positions[shared]]
+        second_counts = candidate_counts[shared]
+        shared_ids = candidate_ids[shared]
+
+        def sum_per_candidate(values):
+            return np.bincount(shared_ids, weights=values, minlength=len(candidates))
+
+        duplicate_count = sum_per_candidate(np.minimum(first_counts, second_counts))
+        unique_in_first_count = file_meta.line_count - sum_per_candidate(first_counts)
+        unique_in_second_count = np.array([candidate.line_count for candidate in candidates]) \
+            - sum_per_candidate(second_counts) + sum_per_candidate(np.maximum(second_counts - first_counts, 0))
+        unique_count = unique_in_first_count + unique_in_second_count
+        overall_lines = unique_count + duplicate_count
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            uniqueness_scores = np.where(overall_lines > 0, np.rint(unique_count / overall_lines * 100), 100).astype(np.int64)
+        if file_meta.is_picture():
+            pictures = [candidate_nr for candidate_nr, candidate in enumerate(candidates) if candidate.is_picture()]
+            if pictures:
+                uniqueness_scores[pictures] = Comparator.get_picture_uniqueness_scores(
+                    file_meta.perceptual_hash, np.array([candidates[nr].perceptual_hash for nr in pictures], dtype=np.int64))
+        for candidate_nr, candidate in enumerate(candidates):
+            if Comparator.is_identical(file_meta, candidate):
+                uniqueness_scores[candidate_nr] = 0
+        return uniqueness_scores
 
-        first_hash_multi_map = dict(first_file_meta.hash_multi_map)
-        second_hash_multi_map = dict(second_file_meta.hash_multi_map)
+    @staticmethod
+    def get_uniqueness_scores_for_pairs(first_file_metas: list[FileMeta], second_file_metas: list[FileMeta],
+                                        candidate_pairs: t.Iterable[tuple[int, int]]) -> dict[tuple[int, int], int]:
+        """
+        Uniqueness scores of (index in first_file_metas, index in second_file_metas) pairs, batched per first file.
+        """
+        candidates_per_first: dict[int, list[int]] = defaultdict(list)
+        pair_count = 0
+        for i, j in candidate_pairs:
+            candidates_per_first[i].append(j)
+            pair_count += 1
+        uniqueness_scores: dict[tuple[int, int], int] = {}
+        with instrumentation.progress('Scoring', pair_count, 'pairs') as progress:
+            for i, candidates in candidates_per_first.items():
+                scores = Comparator.get_uniqueness_scores(first_file_metas[i], [second_file_metas[j] for j in candidates])
+                uniqueness_scores.update(zip(((i, j) for j in candidates), scores.tolist()))
+                progress.advance(len(candidates))
+        instrumentation.count('pairs scored', len(uniqueness_scores))
+        return uniqueness_scores
+
+    @staticmethod
+    def collect_line_differences(file_comparison: FileComparison):
+        """
+        Fill the duplicate and unique lines of a comparison, only needed for pairs which end up in the report.
+        """
+        first_hash_multi_map = file_comparison.first_file_meta.hash_multi_map
+        second_hash_multi_map = file_comparison.second_file_meta.hash_multi_map
 
         duplicate_lines = []
         unique_in_first = []
         unique_in_second = []
-
-        if first_file_meta.file_name == 'index.html' and second_file_meta.file_name == 'index.html':
-            # TODO DELETE
-            pass
-
-        for line_hash, lines in dict(first_hash_multi_map).items():
+        for line_hash, lines in first_hash_multi_map.items():
             if line_hash in second_hash_multi_map:
-                if len(lines) == len(second_hash_multi_map[line_hash]):
-                    duplicate_lines.extend(lines)
-                    first_hash_multi_map.pop(line_hash)
-                    second_hash_multi_map.pop(line_hash)
-                else:
-                    while line_hash in second_hash_multi_map and line_hash in first_hash_multi_map and second_hash_multi_map[line_hash] and first_hash_multi_map[line_hash]:
-                        f = first_hash_multi_map[line_hash].pop()
-                        s = second_hash_multi_map[line_hash].pop()
-                        if len(first_hash_multi_map[line_hash]) == 0:
-                            first_hash_multi_map.pop(line_hash)
-                            # del first_hash_multi_map[line_hash]
-                        if len(second_hash_multi_map[line_hash]) == 0:
-                            second_hash_multi_map.pop(line_hash)
-                            # del second_hash_multi_map[line_hash]
-                        duplicate_lines.append(f)
-                    # min_count = min(len(lines), len(second_hash_multi_map[line_hash]))
-                    # duplicate_lines.extend(lines[:min_count])
-                    # second_hash_multi_map[line_hash] = second_hash_multi_map[line_hash][:-min_count]
-                    # first_hash_multi_map[line_hash] = first_hash_multi_map[line_hash][:-min_count]
+                # the last lines of the more frequent side are the duplicates, its surplus is unique only in second
+                second_lines = second_hash_multi_map.pop(line_hash)
+                duplicate_count = min(len(lines), len(second_lines))
+                duplicate_lines.extend(lines[-duplicate_count:])
+                unique_in_second.extend(second_lines[:len(second_lines) - duplicate_count])
             else:
                 unique_in_first.extend(lines)
-
-        # for d_line in duplicate_lines:
-        #     if d_line.content_hash in second_hash_multi_map:
-        #         del second_hash_multi_map[d_line.content_hash]
-
         for line_hash, lines in second_hash_multi_map.items():
             unique_in_second.extend(lines)
 
-        unique_in_first_count = len(unique_in_first)
-        unique_in_second_count = len(unique_in_second)
-        duplicate_lines_count = len(duplicate_lines)
-        overall_lines = unique_in_first_count + unique_in_second_count + duplicate_lines_count
-
-        if overall_lines > 0:
-            uniqueness_score = round((unique_in_first_count + unique_in_second_count) / overall_lines * 100)
-        else:
-            uniqueness_score = 100
-        file_comparison = FileComparison(first_file_meta, second_file_meta, uniqueness_score)
         file_comparison.duplicate_lines = duplicate_lines
         file_comparison.unique_in_first = unique_in_first
         file_comparison.unique_in_second = unique_in_second
-        return file_comparison
-
-
-
 
+    @staticmethod
+    def create_file_comparison(first_file_meta: FileMeta, second_file_meta: FileMeta, uniqueness_score: int) -> FileComparison:
+        file_comparison = FileComparison(first_file_meta, second_file_meta, uniqueness_score)
+        if not Comparator.is_identical(first_file_meta, second_file_meta):
+            Comparator.collect_line_differences(file_comparison)
+        return file_comparison
 
+    @staticmethod
+    def compare_two_file_metas(first_file_meta: FileMeta, second_file_meta: FileMeta) -> FileComparison:
+        uniqueness_score = int(Comparator.get_uniqueness_scores(first_file_meta, [second_file_meta])[0])
+        return Comparator.create_file_comparison(first_file_meta, second_file_meta, uniqueness_score)
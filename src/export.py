@@ -0,0 +1,178 @@
+import json
+import os
+import typing as t
+
+from .comparator import Comparator, FileComparison, FileMeta, LineMeta
+
+JSONL = 'jsonl'
+PARQUET = 'parquet'
+write_buffer_size = 1 << 20
+
+
+def get_line_ranges(line_metas: t.Iterable[LineMeta], file_meta: FileMeta) -> list[list[int]]:
+    """
+    Collapse lines into [first line nr, last line nr] ranges of lines which follow each other
+    among the non-empty lines of the file.
+    """
+    positions = {line_nr: position for position, line_nr in enumerate(file_meta.line_nrs.tolist())}
+    ranges = []
+    last_position = None
+    for line_nr in sorted(line_meta.line_nr for line_meta in line_metas):
+        position = positions[line_nr]
+        if last_position is not None and position == last_position + 1:
+            ranges[-1][1] = line_nr
+        else:
+            ranges.append([line_nr, line_nr])
+        last_position = position
+    return ranges
+
+
+def create_comparison_record(file_comparison: FileComparison, with_line_ranges: bool = False) -> dict:
+    first_file_meta = file_comparison.first_file_meta
+    second_file_meta = file_comparison.second_file_meta
+    # line lists are not collected for identical files, all their lines are duplicates
+    identical = Comparator.is_identical(first_file_meta, second_file_meta)
+    record = {
+        'kind': 'identical' if file_comparison.get_similarity() == 100 else 'partial',
+        'first_path': first_file_meta.file_path,
+        'second_path': second_file_meta.file_path,
+        'first_hash': first_file_meta.file_hash,
+        'second_hash': second_file_meta.file_hash,
+        'similarity': file_comparison.get_similarity(),
+        'first_line_count': first_file_meta.line_count,
+        'second_line_count': second_file_meta.line_count,
+        'duplicate_line_count': first_file_meta.line_count if identical else len(file_comparison.duplicate_lines),
+        'unique_in_first_count': len(file_comparison.unique_in_first),
+        'unique_in_second_count': len(file_comparison.unique_in_second),
+    }
+    if with_line_ranges and identical:
+        record['first_duplicate_ranges'] = get_line_ranges(first_file_meta.line_metas, first_file_meta)
+        record['second_duplicate_ranges'] = get_line_ranges(second_file_meta.line_metas, second_file_meta)
+    elif with_line_ranges:
+        unique_in_second = {line_meta.line_nr for line_meta in file_comparison.unique_in_second}
+        record['first_duplicate_ranges'] = get_line_ranges(file_comparison.duplicate_lines, first_file_meta)
+        record['second_duplicate_ranges'] = get_line_ranges(
+            (line_meta for line_meta in second_file_meta.line_metas if line_meta.line_nr not in unique_in_second),
+            second_file_meta
+        )
+    if with_line_ranges:
+        record['copied_block_ranges'] = [
+            [block.first_start_line, block.first_end_line, block.second_start_line, block.second_end_line]
+            for block in file_comparison.copied_blocks
+        ]
+    return record
+
+
+def get_parquet_schema(with_line_ranges: bool = False):
+    """
+    The pyarrow schema of the records, every part file is written with it so that columns which are all None
+    or all empty lists in one batch keep their type and the parts load as one dataset.
+    """
+    import pyarrow as pa
+    fields = [(name, pa.string()) for name in ('kind', 'first_path', 'second_path', 'first_hash', 'second_hash')]
+    fields.extend((name, pa.int64()) for name in ('similarity', 'first_line_count', 'second_line_count', 'duplicate_line_count',
+                                                  'unique_in_first_count', 'unique_in_second_count'))
+    if with_line_ranges:
+        fields.extend((name, pa.list_(pa.list_(pa.int64())))
+                      for name in ('first_duplicate_ranges', 'second_duplicate_ranges', 'copied_block_ranges'))
+    return pa.schema(fields)
+
+
+def create_unique_file_record(file_meta: FileMeta, kind: str, with_line_ranges: bool = False) -> dict:
+    first = kind == 'unique_in_first'
+    record = {
+        'kind': kind,
+        'first_path': file_meta.file_path if first else None,
+        'second_path': None if first else file_meta.file_path,
+        'first_hash': file_meta.file_hash if first else None,
+        'second_hash': None if first else file_meta.file_hash,
+        'similarity': 0,
+        'first_line_count': file_meta.line_count if first else 0,
+        'second_line_count': 0 if first else file_meta.line_count,
+        'duplicate_line_count': 0,
+        'unique_in_first_count': file_meta.line_count if first else 0,
+        'unique_in_second_count': 0 if first else file_meta.line_count,
+    }
+    if with_line_ranges:
+        record['first_duplicate_ranges'] = []
+        record['second_duplicate_ranges'] = []
+        record['copied_block_ranges'] = []
+    return record
+
+
+class StructuredReportSink:
+    """
+    Writes one record per matched pair and per unique file, for dashboards and queries without parsing markdown.
+    Records are collected in batches of batch_size: JSONL batches are appended to report_directory/comparisons.jsonl,
+    Parquet batches (through pyarrow, with one schema for all of them) become part files of the
+    report_directory/comparisons.parquet dataset, which pandas.read_parquet loads as a single frame.
+    """
+
+    def __init__(self, report_directory: str, formats: t.Iterable[str], with_line_ranges: bool = False, batch_size: int = 50000):
+        self.formats = list(formats)
+        unknown_formats = set(self.formats) - {JSONL, PARQUET}
+        if unknown_formats:
+            raise ValueError(f"Unknown structured report formats {sorted(unknown_formats)}, expected {JSONL} or {PARQUET}")
+        self.with_line_ranges = with_line_ranges
+        self.batch_size = batch_size
+        self.record_count = 0
+        self._batch: list[dict] = []
+
+        self._jsonl_file = None
+        if JSONL in self.formats:
+            self._jsonl_file = open(os.path.join(report_directory, 'comparisons.jsonl'), 'w+', buffering=write_buffer_size)
+
+        self._parquet_directory = None
+        self._parquet_part = 0
+        self._parquet_schema = None
+        if PARQUET in self.formats:
+            # fail before the comparison runs, not when the first batch is written
+            try:
+                self._parquet_schema = get_parquet_schema(with_line_ranges)
+            except ImportError:
+                raise ImportError('Writing parquet needs pyarrow installed') from None
+            self._parquet_directory = os.path.join(report_directory, 'comparisons.parquet')
+            os.makedirs(self._parquet_directory, exist_ok=True)
+            for file_name in os.listdir(self._parquet_directory):
+                if file_name.endswith('.parquet'):
+                    os.remove(os.path.join(self._parquet_directory, file_name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, file_comparison: FileComparison):
+        self._add_record(create_comparison_record(file_comparison, self.with_line_ranges))
+
+    def add_unique_files(self, fully_unique_first: list[FileMeta], fully_unique_second: list[FileMeta]):
+        for file_meta in fully_unique_first:
+            self._add_record(create_unique_file_record(file_meta, 'unique_in_first', self.with_line_ranges))
+        for file_meta in fully_unique_second:
+            self._add_record(create_unique_file_record(file_meta, 'unique_in_second', self.with_line_ranges))
+
+    def _add_record(self, record: dict):
+        self._batch.append(record)
+        self.record_count += 1
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._batch:
+            return
+        if self._jsonl_file:
+            self._jsonl_file.write(''.join(json.dumps(record) + '\n' for record in self._batch))
+        if self._parquet_directory:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.Table.from_pylist(self._batch, schema=self._parquet_schema),
+                           os.path.join(self._parquet_directory, f'part-{self._parquet_part:05d}.parquet'))
+            self._parquet_part += 1
+        self._batch = []
+
+    def close(self):
+        self._flush()
+        if self._jsonl_file:
+            self._jsonl_file.close()
+            self._jsonl_file = None
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import re
+import typing as t
+
+import numpy as np
+
+SHA256 = 'sha256'
+BLAKE2B = 'blake2b'
+XXHASH = 'xxhash'  # needs the xxhash package
+
+STRIP_COMMENTS = 'strip_comments'
+COLLAPSE_WHITESPACE = 'collapse_whitespace'
+SKIP_BOILERPLATE = 'skip_boilerplate'
+NORMALIZATION_PASSES = (STRIP_COMMENTS, COLLAPSE_WHITESPACE, SKIP_BOILERPLATE)
+
+# lines which carry no content on their own, skipped like empty lines by SKIP_BOILERPLATE
+default_boilerplate_patterns = [r'[{}()\[\];,]*']
+
+_C_LIKE = ('.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx', '.java', '.kt', '.scala', '.c', '.h', '.cc', '.cpp', '.hpp',
+           '.cs', '.go', '.rs', '.swift', '.php', '.dart', '.sol', '.scss', '.less')
+_HASH_LINE = ('.py', '.sh', '.bash', '.rb', '.pl', '.r', '.yml', '.yaml', '.toml', '.cfg', '.ini', '.conf',
+              '.gitignore', '.dockerignore', '.browserslistrc', '.env')
+_MARKUP = ('.html', '.htm', '.xml', '.svg', '.md')
+
+# extension -> (line comment markers, (block comment start, end) pairs, whether quotes protect comment markers)
+COMMENT_SYNTAX: dict[str, tuple[tuple[str, ...], tuple[tuple[str, str], ...], bool]] = {
+    **{extension: (('//',), (('/*', '*/'),), True) for extension in _C_LIKE},
+    **{extension: (('#',), (), True) for extension in _HASH_LINE},
+    **{extension: ((), (('<!--', '-->'),), False) for extension in _MARKUP},
+    '.css': ((), (('/*', '*/'),), True),
+    '.vue': (('//',), (('/*', '*/'), ('<!--', '-->')), True),
+    '.sql': (('--',), (('/*', '*/'),), True),
+    '.lua': (('--',), (), True),
+}
+
+
+def get_bytes_hasher(algorithm: str) -> t.Callable[[t.Iterable[bytes]], np.ndarray]:
+    """
+    Returns a function hashing all UTF-8 encoded lines of a file into 64 bit integers at once.
+    """
+    if algorithm == SHA256:
+        return lambda values: np.frombuffer(b''.join(hashlib.sha256(value).digest()[:8] for value in values), dtype=np.int64)
+    if algorithm == BLAKE2B:
+        return lambda values: np.frombuffer(
+            b''.join(hashlib.blake2b(value, digest_size=8).digest() for value in values), dtype=np.int64)
+    if algorithm == XXHASH:
+        try:
+            import xxhash
+        except ImportError:
+            raise ImportError('The xxhash line hash algorithm needs the xxhash package installed') from None
+        return lambda values: np.frombuffer(b''.join(xxhash.xxh3_64_digest(value) for value in values), dtype=np.int64)
+    raise ValueError(f"Unknown line hash algorithm {algorithm}, expected {SHA256}, {BLAKE2B} or {XXHASH}")
+
+
+def get_line_hasher(algorithm: str) -> t.Callable[[list[str]], np.ndarray]:
+    """
+    Returns a function hashing all lines of a file into 64 bit integers at once.
+    """
+    hash_values = get_bytes_hasher(algorithm)
+    return lambda lines: hash_values(line.encode('utf-8') for line in lines)
+
+
+def get_comment_syntax(file_path: str) -> t.Optional[tuple[tuple[str, ...], tuple[tuple[str, str], ...], bool]]:
+    file_name = os.path.basename(file_path).lower()
+    if file_name == 'dockerfile':
+        return COMMENT_SYNTAX['.sh']
+    extension = os.path.splitext(file_name)[1] or file_name
+    return COMMENT_SYNTAX.get(extension)
+
+
+class CommentStripper:
+    """
+    Removes the comments of one file from its lines in order, block comments may span several lines.
+    Quotes are followed within a line only, so a comment marker in a string spanning lines is taken as a comment.
+    """
+
+    def __init__(self, line_markers: tuple[str, ...], block_markers: tuple[tuple[str, str], ...], quotes: bool):
+        self.line_markers = line_markers
+        self.block_markers = block_markers
+        self.quotes = '\'"`' if quotes else ''
+        self.markers = line_markers + tuple(start for start, _ in block_markers)
+        self.marker_chars = {marker[0] for marker in self.markers}
+        self.block_end: t.Optional[str] = None
+
+    def strip(self, line: str) -> str:
+        if self.block_end is None and not any(marker in line for marker in self.markers):
+            return line
+        kept = []
+        quote = None
+        position = 0
+        while position < len(line):
+            if self.block_end is not None:
+                end = line.find(self.block_end, position)
+                if end < 0:
+                    break
+                position = end + len(self.block_end)
+                self.block_end = None
+                continue
+            char = line[position]
+            if quote:
+                kept.append(line[position:position + 2] if char == '\\' else char)
+                position += 2 if char == '\\' else 1
+                if char == quote:
+                    quote = None
+                continue
+            if char in self.quotes:
+                quote = char
+            elif char in self.marker_chars:
+                if any(line.startswith(marker, position) for marker in self.line_markers):
+                    break
+                block = next((block for block in self.block_markers if line.startswith(block[0], position)), None)
+                if block:
+                    self.block_end = block[1]
+                    position += len(block[0])
+                    continue
+            kept.append(char)
+            position += 1
+        return ''.join(kept).strip()
+
+
+def normalize_lines(lines: t.Iterable[str], file_path: str, passes: t.Sequence[str],
+                    boilerplate_patterns: t.Sequence[str] = ()) -> t.Iterator[str]:
+    """
+    Applies the normalization passes to the stripped lines of a file, all of them in a single pass over the lines.
+    Yields one line per input line, lines without content left become empty and are skipped like empty lines.
+    """
+    unknown_passes = set(passes) - set(NORMALIZATION_PASSES)
+    if unknown_passes:
+        raise ValueError(f"Unknown normalization passes {sorted(unknown_passes)}, expected any of {NORMALIZATION_PASSES}")
+    comment_syntax = get_comment_syntax(file_path) if STRIP_COMMENTS in passes else None
+    strip_comments = CommentStripper(*comment_syntax).strip if comment_syntax else None
+    collapse_whitespace = COLLAPSE_WHITESPACE in passes
+    boilerplate = re.compile('|'.join(f'(?:{pattern})' for pattern in boilerplate_patterns)) \
+        if SKIP_BOILERPLATE in passes and boilerplate_patterns else None
+
+    for line in lines:
+        if strip_comments and line:
+            line = strip_comments(line)
+        if collapse_whitespace and line:
+            line = ' '.join(line.split())
+        if boilerplate and line and boilerplate.fullmatch(line):
+            line = ''
+        yield line
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+import typing as t
+
+from .comparator import FileFingerprint
+
+# bump whenever the content of a FileFingerprint changes, an outdated cache is dropped on open
+CACHE_FORMAT_VERSION = 5
+
+
+class FingerprintCache:
+    """
+    Persistent SQLite cache of file fingerprints, keyed by the absolute path, size and mtime of a file.
+    With match_content_hash a file whose stat changed but whose content is known (touched, copied or moved)
+    is served from the cache as well, at the cost of reading and hashing the whole file.
+    Fingerprints depend on the line hash algorithm and normalization, the cache is emptied when settings differ
+    from the ones it was filled with.
+    """
+
+    def __init__(self, cache_file_path: str, match_content_hash: bool = False, settings: tuple = ()):
+        self.cache_file_path = cache_file_path
+        self.match_content_hash = match_content_hash
+        self.hits = 0
+        self.content_hash_hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+        directory = os.path.dirname(cache_file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(cache_file_path)
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != CACHE_FORMAT_VERSION:
+            self.connection.execute('DROP TABLE IF EXISTS fingerprints')
+            self.connection.execute(f'PRAGMA user_version = {CACHE_FORMAT_VERSION}')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, file_hash TEXT, lines BLOB, last_used REAL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS fingerprints_file_hash ON fingerprints (file_hash)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS settings (settings TEXT)')
+        stored_settings = self.connection.execute('SELECT settings FROM settings').fetchone()
+        if stored_settings is None or stored_settings[0] != repr(settings):
+            self.connection.execute('DELETE FROM fingerprints')
+            self.connection.execute('DELETE FROM settings')
+            self.connection.execute('INSERT INTO settings VALUES (?)', (repr(settings),))
+        self.connection.commit()
+
+    @staticmethod
+    def get_stat_key(file_path) -> tuple[str, int, int]:
+        stat = os.stat(file_path)
+        return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+    def get_stat_keys(self, folder_path) -> set[tuple[str, int, int]]:
+        """
+        Stat keys of all entries below folder_path, to tell cached files apart without a query, e.g. in other threads.
+        """
+        prefix = os.path.join(os.path.abspath(folder_path), '')
+        return set(self.connection.execute(
+            'SELECT path, size, mtime_ns FROM fingerprints WHERE substr(path, 1, ?) = ?', (len(prefix), prefix)
+        ))
+
+    def get_many_by_stat_keys(self, stat_keys: list[tuple[str, tuple[str, int, int]]]) -> dict[str, FileFingerprint]:
+        """
+        Returns the cached fingerprints of all unchanged files which have been stat already, every other file counts
+        as a miss.
+        """
+        fingerprints = {}
+        now = time.time()
+        refreshed = []
+        for file_path, (path, size, mtime_ns) in stat_keys:
+            row = self.connection.execute(
+                'SELECT file_hash, lines FROM fingerprints WHERE path = ? AND size = ? AND mtime_ns = ?',
+                (path, size, mtime_ns)
+            ).fetchone()
+            if row is None and self.match_content_hash:
+                row = self._get_by_content_hash(file_path)
+                if row is not None:
+                    self.content_hash_hits += 1
+                    self.connection.execute(
+                        'INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)',
+                        (path, size, mtime_ns, row[0], row[1], now)
+                    )
+            if row is None:
+                self.misses += 1
+                continue
+            self.hits += 1
+            file_hash, lines = row
+            fingerprints[file_path] = (file_hash, *pickle.loads(lines))
+            refreshed.append((now, path))
+        self.connection.executemany('UPDATE fingerprints SET last_used = ? WHERE path = ?', refreshed)
+        self.connection.commit()
+        return fingerprints
+
+    def _get_by_content_hash(self, file_path, file_hash: t.Optional[str] = None):
+        if file_hash is None:
+            with open(file_path, 'rb') as file:
+                file_hash = hashlib.sha256(file.read()).hexdigest()
+        return self.connection.execute(
+            'SELECT file_hash, lines FROM fingerprints WHERE file_hash = ? LIMIT 1', (file_hash,)
+        ).fetchone()
+
+    def get_for_read_file(self, file_path, stat_key: tuple[str, int, int],
+                          buffer: t.Optional[bytes]) -> t.Optional[FileFingerprint]:
+        """
+        For a file which is not cached under its stat key and has been read already: with match_content_hash the
+        fingerprint of a file with the same content, None otherwise. Counts as a hit or a miss like get_many_by_stat_keys.
+        A file too large to be read at once has no buffer and is not looked up by its content.
+        """
+        row = self._get_by_content_hash(file_path, hashlib.sha256(buffer).hexdigest()) \
+            if self.match_content_hash and buffer is not None else None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.content_hash_hits += 1
+        self.connection.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)', (*stat_key, *row, time.time()))
+        self.connection.commit()
+        return row[0], *pickle.loads(row[1])
+
+    def put_many(self, fingerprints: t.Iterable[tuple[str, FileFingerprint]],
+                 stat_keys: t.Optional[dict[str, tuple[str, int, int]]] = None):
+        now = time.time()
+        rows = []
+        for file_path, (file_hash, *lines) in fingerprints:
+            path, size, mtime_ns = stat_keys[file_path] if stat_keys else self.get_stat_key(file_path)
+            rows.append((path, size, mtime_ns, file_hash, pickle.dumps(tuple(lines), pickle.HIGHEST_PROTOCOL), now))
+        self.connection.executemany('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.connection.commit()
+
+    def evict_missing(self, folder_path, existing_file_paths: list[str]):
+        """
+        Drops the entries of files below folder_path which no longer exist or are excluded now.
+        """
+        existing = {os.path.abspath(file_path) for file_path in existing_file_paths}
+        prefix = os.path.join(os.path.abspath(folder_path), '')
+        stale = [(path,) for (path,) in self.connection.execute(
+            "SELECT path FROM fingerprints WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+        ) if path not in existing]
+        self.connection.executemany('DELETE FROM fingerprints WHERE path = ?', stale)
+        self.connection.commit()
+        self.evicted += len(stale)
+
+    def evict_unused(self, max_age_seconds: float):
+        """
+        Drops the entries which have not been used for max_age_seconds, e.g. of folders no longer compared.
+        """
+        cursor = self.connection.execute('DELETE FROM fingerprints WHERE last_used < ?', (time.time() - max_age_seconds,))
+        self.connection.commit()
+        self.evicted += cursor.rowcount
+
+    def invalidate(self):
+        self.connection.execute('DELETE FROM fingerprints')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def get_statistics(self) -> str:
+        return f'Fingerprint cache: {self.hits} hits ({self.content_hash_hits} by content hash), ' \
+               f'{self.misses} misses, {self.evicted} stale entries evicted'
@@ -0,0 +1,102 @@
+import os
+import re
+import typing as t
+
+GITIGNORE = '.gitignore'
+GIT_DIRECTORY = '.git'  # never compared with the .gitignore files respected, like git never adds it
+
+
+def translate_pattern(pattern: str) -> str:
+    """
+    Regular expression of a .gitignore pattern, without its leading ! and trailing /, matching whole paths relative
+    to the directory of the pattern. Patterns without a slash match a name at any depth.
+    """
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    parts = []
+    position = 0
+    while position < len(pattern):
+        if pattern.startswith('**/', position):
+            parts.append('(?:.*/)?')
+            position += 3
+        elif pattern.startswith('**', position):
+            parts.append('.*')
+            position += 2
+        else:
+            char = pattern[position]
+            end = pattern.find(']', position + 2) if char == '[' else -1
+            if char == '*':
+                parts.append('[^/]*')
+            elif char == '?':
+                parts.append('[^/]')
+            elif end > 0:
+                characters = pattern[position + 1:end]
+                parts.append('[' + ('^' + characters[1:] if characters[0] == '!' else characters) + ']')
+                position = end
+            elif char == '\\' and position + 1 < len(pattern):
+                position += 1
+                parts.append(re.escape(pattern[position]))
+            else:
+                parts.append(re.escape(char))
+            position += 1
+    return ('' if anchored else '(?:.*/)?') + ''.join(parts)
+
+
+class IgnorePatterns:
+    """
+    Patterns of files and directories to leave out of a comparison, in the syntax of .gitignore: ! re-includes,
+    a trailing / matches directories only, a / elsewhere anchors the pattern to base_directory, ** spans directories.
+    As in git, the last matching pattern decides.
+    """
+
+    def __init__(self, patterns: t.Iterable[str], base_directory: str):
+        self.base_directory = base_directory
+        self._base_prefix = os.path.join(base_directory, '')
+        self.rules: list[tuple[re.Pattern, bool, bool]] = []
+        for pattern in patterns:
+            pattern = pattern.rstrip('\n')
+            if not pattern.endswith('\\ '):
+                pattern = pattern.rstrip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            negated = pattern.startswith('!')
+            if negated or pattern.startswith('\\!') or pattern.startswith('\\#'):
+                pattern = pattern[1:]
+            directory_only = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            if not pattern:
+                continue
+            try:
+                regex = re.compile(translate_pattern(pattern))
+            except re.error:
+                # like a bracket expression such as [z-a], which git takes as matching nothing
+                continue
+            self.rules.append((regex, negated, directory_only))
+
+    @staticmethod
+    def from_file(file_path: str) -> 'IgnorePatterns':
+        with open(file_path, encoding='utf-8', errors='replace') as file:
+            return IgnorePatterns(file, os.path.dirname(file_path))
+
+    def match(self, path: str, is_directory: bool) -> t.Optional[bool]:
+        """
+        Returns whether path, below base_directory, is ignored, or None if no pattern matches it.
+        """
+        relative_path = path[len(self._base_prefix):]
+        if os.sep != '/':
+            relative_path = relative_path.replace(os.sep, '/')
+        for regex, negated, directory_only in reversed(self.rules):
+            if (is_directory or not directory_only) and regex.fullmatch(relative_path):
+                return not negated
+        return None
+
+
+def is_ignored(path: str, is_directory: bool, ignore_patterns: t.Sequence[IgnorePatterns]) -> bool:
+    """
+    Whether path is ignored by the innermost of the nested ignore_patterns, ordered from the outermost, matching it.
+    """
+    for patterns in reversed(ignore_patterns):
+        ignored = patterns.match(path, is_directory)
+        if ignored is not None:
+            return ignored
+    return False
@@ -0,0 +1,162 @@
+import os
+import pickle
+import typing as t
+
+import numpy as np
+
+from . import instrumentation
+from .comparator import Comparator, FileMeta
+from .line_index import CandidateIndex, LineHashIndex, get_frequent_line_hashes
+from .matching import match, get_components, merge_component_matches
+
+# bump whenever the content of a ComparisonState changes, an outdated state is ignored
+STATE_FORMAT_VERSION = 3
+# with more changed files than this share of all files, scoring everything through the line index is faster
+full_rescore_share = 0.25
+
+
+class ComparisonState:
+    """
+    What a comparison run needs to redo only the work touched by changed files on the next run: the hash of every
+    compared file, the scores of all candidate pairs and the matches of every connected component of the candidate
+    graph. Files are referred to by path, pairs by (first path, second path).
+    """
+
+    def __init__(self, settings: tuple):
+        self.settings = settings
+        self.first_files: dict[str, str] = {}
+        self.second_files: dict[str, str] = {}
+        self.uniqueness_scores: dict[tuple[str, str], int] = {}
+        self.node_components: dict[tuple[int, str], int] = {}  # (0 first / 1 second, path) -> component
+        self.component_sizes: list[int] = []
+        self.component_matches: list[list[tuple[str, str]]] = []
+
+    @staticmethod
+    def load(state_file: str, settings: tuple) -> 'ComparisonState':
+        """
+        Loads the state of the previous run, or returns an empty state if there is none for these settings.
+        """
+        try:
+            with open(state_file, 'rb') as file:
+                version, state = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            return ComparisonState(settings)
+        if version != STATE_FORMAT_VERSION or state.settings != settings:
+            return ComparisonState(settings)
+        return state
+
+    def save(self, state_file: str):
+        directory = os.path.dirname(state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(state_file + '.tmp', 'wb') as file:
+            pickle.dump((STATE_FORMAT_VERSION, self), file, pickle.HIGHEST_PROTOCOL)
+        os.replace(state_file + '.tmp', state_file)
+
+
+def get_changed_files(file_metas: list[FileMeta], previous_files: dict[str, str]) -> list[int]:
+    return [index for index, file_meta in enumerate(file_metas) if previous_files.get(file_meta.file_path) != file_meta.file_hash]
+
+
+def get_candidates_of_changed(changed_file_metas: list[tuple[int, FileMeta]], other_file_metas: list[FileMeta],
+                              min_shared_lines: int, frequent_hashes: np.ndarray) -> t.Iterator[tuple[int, int]]:
+    """
+    Yields (changed index, other index) for every file of the other side sharing at least min_shared_lines
+    distinct lines, not counting frequent_hashes, with a changed file, plus similar pictures, the same pairs
+    LineHashIndex proposes.
+    """
+    if not changed_file_metas or not other_file_metas:
+        return
+    other_hash_counts = [file_meta.get_hash_counts()[0] for file_meta in other_file_metas]
+    other_hashes = np.concatenate(other_hash_counts)
+    other_ids = np.repeat(np.arange(len(other_file_metas)), [len(hashes) for hashes in other_hash_counts])
+    if len(frequent_hashes):
+        counted = ~np.isin(other_hashes, frequent_hashes)
+        other_hashes, other_ids = other_hashes[counted], other_ids[counted]
+    min_shared_lines = max(min_shared_lines, 1)
+    other_pictures = CandidateIndex(other_file_metas)
+
+    for changed_index, changed_file_meta in changed_file_metas:
+        shared_lines = np.bincount(other_ids[np.isin(other_hashes, changed_file_meta.get_hash_counts()[0])],
+                                   minlength=len(other_file_metas))
+        candidates = set(np.flatnonzero(shared_lines >= min_shared_lines).tolist())
+        if changed_file_meta.is_picture() and len(other_pictures.picture_files):
+            candidates.update(other_pictures.picture_files[Comparator.get_picture_uniqueness_scores(
+                changed_file_meta.perceptual_hash, other_pictures.perceptual_hashes) < 100].tolist())
+        for other_index in candidates:
+            yield changed_index, other_index
+
+
+def score_and_match_incrementally(state: ComparisonState, first_file_metas: list[FileMeta], second_file_metas: list[FileMeta],
+                                  similarity_lower_bound: int, min_shared_lines: int,
+                                  max_line_occurrences: t.Optional[int], matching_mode: str) -> tuple[dict[tuple[int, int], int], list[tuple[int, int]]]:
+    """
+    Scores and matches first_file_metas against second_file_metas like a full run, reusing the state of the previous
+    run: only pairs involving an added or modified file are scored, and only components of the candidate graph which
+    differ from the previous run are matched again. The state is updated in place.
+    Returns the uniqueness scores and the matches by index, exactly as a full run would.
+    """
+    changed_first = get_changed_files(first_file_metas, state.first_files)
+    changed_second = get_changed_files(second_file_metas, state.second_files)
+    removed_count = len(state.first_files.keys() - {fm.file_path for fm in first_file_metas}) \
+        + len(state.second_files.keys() - {fm.file_path for fm in second_file_metas})
+    print(f'Incremental comparison: {len(changed_first) + len(changed_second)} added or modified, {removed_count} removed files')
+
+    first_index = {file_meta.file_path: i for i, file_meta in enumerate(first_file_metas)}
+    second_index = {file_meta.file_path: j for j, file_meta in enumerate(second_file_metas)}
+    changed_first_set = set(changed_first)
+    changed_second_set = set(changed_second)
+
+    uniqueness_scores: dict[tuple[int, int], int] = {}
+    if len(changed_first) + len(changed_second) > full_rescore_share * (len(first_file_metas) + len(second_file_metas)):
+        candidate_pairs = LineHashIndex(first_file_metas).get_candidate_pairs(
+            LineHashIndex(second_file_metas), min_shared_lines, max_line_occurrences)
+    else:
+        # lines too frequent on either side are not counted, on the side of the changed files too
+        frequent_hashes = np.union1d(get_frequent_line_hashes(first_file_metas, max_line_occurrences),
+                                     get_frequent_line_hashes(second_file_metas, max_line_occurrences))
+        candidate_pairs = set(get_candidates_of_changed(
+            [(i, first_file_metas[i]) for i in changed_first], second_file_metas, min_shared_lines, frequent_hashes))
+        candidate_pairs.update((i, j) for j, i in get_candidates_of_changed(
+            [(j, second_file_metas[j]) for j in changed_second], first_file_metas, min_shared_lines, frequent_hashes))
+        # the scores of pairs of unchanged files are kept
+        for (first_path, second_path), uniqueness_score in state.uniqueness_scores.items():
+            i = first_index.get(first_path)
+            j = second_index.get(second_path)
+            if i is not None and j is not None and i not in changed_first_set and j not in changed_second_set:
+                uniqueness_scores[(i, j)] = uniqueness_score
+    instrumentation.count('pairs reused', len(uniqueness_scores))
+    uniqueness_scores.update(Comparator.get_uniqueness_scores_for_pairs(first_file_metas, second_file_metas, candidate_pairs))
+    print(f'{len(uniqueness_scores)} candidate pairs, {len(candidate_pairs)} of them scored in this run')
+
+    # a component is matched again unless it consists of exactly the unchanged files of a previous component
+    components = get_components([(i, j, 100 - u) for (i, j), u in uniqueness_scores.items()], similarity_lower_bound)
+    component_matches = []
+    node_components: dict[tuple[int, str], int] = {}
+    rematched = 0
+    for component_nr, component in enumerate(components):
+        nodes = {(0, first_file_metas[i].file_path) for i, _, _ in component} | {(1, second_file_metas[j].file_path) for _, j, _ in component}
+        previous_components = {state.node_components.get(node) for node in nodes}
+        previous_component = next(iter(previous_components))
+        unchanged = len(previous_components) == 1 and previous_component is not None \
+            and state.component_sizes[previous_component] == len(nodes) \
+            and not any(i in changed_first_set or j in changed_second_set for i, j, _ in component)
+        if unchanged:
+            matches = [(first_index[first_path], second_index[second_path])
+                       for first_path, second_path in state.component_matches[previous_component]]
+        else:
+            matches = match(component, similarity_lower_bound, matching_mode)
+            rematched += 1
+        component_matches.append(matches)
+        node_components.update(dict.fromkeys(nodes, component_nr))
+    print(f'{rematched} of {len(components)} components of similar files matched again')
+
+    state.first_files = {file_meta.file_path: file_meta.file_hash for file_meta in first_file_metas}
+    state.second_files = {file_meta.file_path: file_meta.file_hash for file_meta in second_file_metas}
+    state.uniqueness_scores = {(first_file_metas[i].file_path, second_file_metas[j].file_path): u
+                               for (i, j), u in uniqueness_scores.items()}
+    state.node_components = node_components
+    state.component_sizes = [len({(0, i) for i, _, _ in c} | {(1, j) for _, j, _ in c}) for c in components]
+    state.component_matches = [[(first_file_metas[i].file_path, second_file_metas[j].file_path) for i, j in matches]
+                               for matches in component_matches]
+    return uniqueness_scores, merge_component_matches(component_matches)
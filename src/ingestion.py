@@ -0,0 +1,321 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import typing as t
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from . import instrumentation
+from .comparator import Comparator, FileFingerprint, FingerprintSettings
+
+if t.TYPE_CHECKING:
+    from .fingerprint_cache import FingerprintCache
+
+# marks the end of a queue, one per consuming thread
+_END = None
+# in place of the buffer of a file too large to be queued, the hashing stage reads it in blocks itself
+_UNREAD = object()
+# how often a blocked stage checks whether the pipeline was stopped
+_POLL_SECONDS = 0.1
+
+
+class PipelineStopped(Exception):
+    pass
+
+
+def _get_worker_context():
+    # the hash workers are started while the scan and reader threads run, forking then could copy a lock held by
+    # one of them into a worker, a fork server forks from a process without those threads
+    return multiprocessing.get_context('forkserver') if 'forkserver' in multiprocessing.get_all_start_methods() else None
+
+
+def _fingerprint_buffer_timed(file_path, buffer: bytes, settings: FingerprintSettings) -> tuple[FileFingerprint, float]:
+    started = time.perf_counter()
+    return Comparator.fingerprint_buffer(file_path, buffer, settings), time.perf_counter() - started
+
+
+def _fingerprint_stream_timed(file_path, settings: FingerprintSettings) -> tuple[FileFingerprint, float]:
+    started = time.perf_counter()
+    with open(file_path, 'rb') as file:
+        return Comparator.fingerprint_stream(file_path, file, settings), time.perf_counter() - started
+
+
+class StageStatistics:
+    """
+    Files and bytes through one ingestion stage. Busy time is summed over the threads of the stage,
+    rates are over the time from the first to the last file of the stage.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.files = 0
+        self.bytes = 0
+        self.busy_seconds = 0.0
+        self.started: t.Optional[float] = None
+        self.finished: t.Optional[float] = None
+
+    def add(self, size: int, started: float, finished: float):
+        self.files += 1
+        self.bytes += size
+        self.busy_seconds += finished - started
+        self.started = started if self.started is None else min(self.started, started)
+        self.finished = finished if self.finished is None else max(self.finished, finished)
+
+    def merge(self, other: 'StageStatistics'):
+        self.files += other.files
+        self.bytes += other.bytes
+        self.busy_seconds += other.busy_seconds
+        if other.started is not None:
+            self.started = other.started if self.started is None else min(self.started, other.started)
+            self.finished = other.finished if self.finished is None else max(self.finished, other.finished)
+
+    def __str__(self):
+        elapsed = max((self.finished or 0.0) - (self.started or 0.0), 1e-9)
+        if not self.bytes:
+            return f'{self.name} {self.files} files, {self.files / elapsed:,.0f} files/s, {self.busy_seconds:.2f}s busy'
+        return f'{self.name} {self.files} files, {self.bytes / 2 ** 20:.1f} MiB, {self.files / elapsed:,.0f} files/s, ' \
+               f'{self.bytes / 2 ** 20 / elapsed:.1f} MiB/s, {self.busy_seconds:.2f}s busy'
+
+
+class ByteBudget:
+    """
+    Bounds the bytes of read files waiting to be hashed, a file larger than the whole budget is let through alone.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size: int, stopped: threading.Event):
+        with self.condition:
+            while self.used and self.used + size > self.max_bytes:
+                if stopped.is_set():
+                    raise PipelineStopped()
+                self.condition.wait(_POLL_SECONDS)
+            self.used += size
+
+    def release(self, size: int):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+
+class IngestionPipeline:
+    """
+    Fingerprints the files of a folder with directory scanning, file reads and hashing overlapping, for file systems
+    where the latency of every stat and open dominates, like NFS:
+
+        scan thread --paths--> reader threads --buffers--> hashing in this thread or in hash_workers processes
+
+    Both queues hold at most max_queued_files files and the buffers read but not hashed yet at most max_queued_bytes,
+    so a slow stage holds back the stages before it. Every file is read once, files cached under their stat key
+    are not read at all. Files larger than stream_file_size are not queued, the hashing stage reads them in blocks.
+    File paths and fingerprints are returned in the order of Comparator.iterate_file_paths.
+    """
+
+    def __init__(self, readers: int = 8, hash_workers: int = 1, max_queued_files: int = 256,
+                 max_queued_bytes: int = 256 << 20, settings: t.Optional[FingerprintSettings] = None,
+                 stream_file_size: int = 64 << 20):
+        self.readers = max(1, readers)
+        self.hash_workers = max(1, hash_workers)
+        self.max_queued_files = max_queued_files
+        self.max_queued_bytes = max_queued_bytes
+        self.settings = settings or Comparator.get_fingerprint_settings()
+        self.stream_file_size = stream_file_size
+        self.folder_path = None
+        self.scan_statistics = StageStatistics('scanned')
+        self.read_statistics = StageStatistics('read')
+        self.hash_statistics = StageStatistics('hashed')
+        self.cached_files = 0
+        self._stopped = threading.Event()
+        self._hash_statistics_lock = threading.Lock()
+
+    def run(self, folder_path, cache: 'FingerprintCache' = None) -> tuple[list[str], dict[str, FileFingerprint]]:
+        self.folder_path = folder_path
+        cached_stat_keys = cache.get_stat_keys(folder_path) if cache else set()
+        path_queue = queue.Queue(self.max_queued_files)
+        buffer_queue = queue.Queue(self.max_queued_files)
+        byte_budget = ByteBudget(self.max_queued_bytes)
+        file_paths: list[str] = []
+        reader_statistics = [StageStatistics('read') for _ in range(self.readers)]
+
+        # the total is known once the scan is done
+        progress = instrumentation.progress(f'Ingesting {folder_path}', unit='files')
+        threads = [threading.Thread(target=self._scan, daemon=True,
+                                    args=(folder_path, file_paths, path_queue, buffer_queue, progress))]
+        threads.extend(threading.Thread(target=self._read, daemon=True, args=(
+            path_queue, buffer_queue, byte_budget, cached_stat_keys, statistics)) for statistics in reader_statistics)
+        for thread in threads:
+            thread.start()
+
+        executor = None
+        try:
+            fingerprints: dict[str, FileFingerprint] = {}
+            pending: list[tuple[str, Future]] = []
+            cached: list[tuple[str, tuple[str, int, int]]] = []
+            read_stat_keys: dict[str, tuple[str, int, int]] = {}
+            ended_readers = 0
+            while ended_readers < self.readers:
+                item = buffer_queue.get()
+                if item is _END:
+                    ended_readers += 1
+                    continue
+                progress.advance()
+                file_path, stat_key, buffer, error = item
+                if error is not None:
+                    raise error
+                if buffer is None:
+                    cached.append((file_path, stat_key))
+                    continue
+                unread = buffer is _UNREAD
+                size, queued_size = (stat_key[1], 0) if unread else (len(buffer), len(buffer))
+                fingerprint = cache.get_for_read_file(file_path, stat_key, None if unread else buffer) if cache else None
+                if fingerprint is not None:
+                    fingerprints[file_path] = fingerprint
+                    self.cached_files += 1
+                    byte_budget.release(queued_size)
+                    continue
+                read_stat_keys[file_path] = stat_key
+                if self.hash_workers == 1:
+                    fingerprint, busy_seconds = _fingerprint_stream_timed(file_path, self.settings) if unread \
+                        else _fingerprint_buffer_timed(file_path, buffer, self.settings)
+                    fingerprints[file_path] = fingerprint
+                    finished = time.perf_counter()
+                    self.hash_statistics.add(size, finished - busy_seconds, finished)
+                    byte_budget.release(queued_size)
+                    continue
+                executor = executor or ProcessPoolExecutor(max_workers=self.hash_workers, mp_context=_get_worker_context())
+                future = executor.submit(_fingerprint_stream_timed, file_path, self.settings) if unread \
+                    else executor.submit(_fingerprint_buffer_timed, file_path, buffer, self.settings)
+                future.add_done_callback(self._get_hashed_callback(size, queued_size, byte_budget))
+                pending.append((file_path, future))
+            for file_path, future in pending:
+                fingerprints[file_path] = future.result()[0]
+        except BaseException:
+            self._stopped.set()
+            raise
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+            for thread in threads:
+                thread.join()
+            progress.finish()
+
+        for statistics in reader_statistics:
+            self.read_statistics.merge(statistics)
+        if cache:
+            cached_fingerprints = cache.get_many_by_stat_keys(cached)
+            self.cached_files += len(cached_fingerprints)
+            fingerprints.update(cached_fingerprints)
+            # an entry evicted since its stat key was looked up
+            for file_path, _ in cached:
+                if file_path not in fingerprints:
+                    fingerprints[file_path] = Comparator.fingerprint_file(file_path, self.settings)
+            cache.put_many([(file_path, fingerprints[file_path]) for file_path in read_stat_keys], read_stat_keys)
+        instrumentation.count('files hashed', len(read_stat_keys))
+        instrumentation.count('lines hashed', sum(len(fingerprints[file_path][2]) for file_path in read_stat_keys))
+        instrumentation.count('bytes read', self.read_statistics.bytes)
+        instrumentation.count('cache hits', self.cached_files)
+        return file_paths, fingerprints
+
+    def _get_hashed_callback(self, size: int, queued_size: int, byte_budget: ByteBudget):
+        def hashed(future: Future):
+            # runs in a thread of the executor, or in this one if the future is done already
+            byte_budget.release(queued_size)
+            if future.cancelled() or future.exception():
+                return
+            finished = time.perf_counter()
+            with self._hash_statistics_lock:
+                self.hash_statistics.add(size, finished - future.result()[1], finished)
+        return hashed
+
+    def _put(self, target_queue: queue.Queue, item):
+        while True:
+            if self._stopped.is_set():
+                raise PipelineStopped()
+            try:
+                target_queue.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    def _get(self, source_queue: queue.Queue):
+        while True:
+            if self._stopped.is_set():
+                raise PipelineStopped()
+            try:
+                return source_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                pass
+
+    def _scan(self, folder_path, file_paths: list[str], path_queue: queue.Queue, buffer_queue: queue.Queue,
+              progress: instrumentation.Progress):
+        try:
+            file_path_iterator = Comparator.iterate_file_paths(folder_path)
+            while True:
+                started = time.perf_counter()
+                file_path = next(file_path_iterator, _END)
+                if file_path is _END:
+                    break
+                self.scan_statistics.add(0, started, time.perf_counter())
+                file_paths.append(file_path)
+                self._put(path_queue, file_path)
+            progress.set_total(len(file_paths))
+        except PipelineStopped:
+            return
+        except Exception as error:
+            # raised by run, ahead of the end of every reader
+            self._put_error(buffer_queue, error)
+        finally:
+            for _ in range(self.readers):
+                try:
+                    self._put(path_queue, _END)
+                except PipelineStopped:
+                    break
+
+    def _read(self, path_queue: queue.Queue, buffer_queue: queue.Queue, byte_budget: ByteBudget,
+              cached_stat_keys: set[tuple[str, int, int]], statistics: StageStatistics):
+        try:
+            while True:
+                file_path = self._get(path_queue)
+                if file_path is _END:
+                    break
+                started = time.perf_counter()
+                try:
+                    stat = os.stat(file_path)
+                    stat_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+                    if stat_key in cached_stat_keys:
+                        self._put(buffer_queue, (file_path, stat_key, None, None))
+                        continue
+                    if stat.st_size > self.stream_file_size:
+                        self._put(buffer_queue, (file_path, stat_key, _UNREAD, None))
+                        continue
+                    byte_budget.acquire(stat.st_size, self._stopped)
+                    with open(file_path, 'rb') as file:
+                        buffer = file.read()
+                except OSError as error:
+                    self._put(buffer_queue, (file_path, None, None, error))
+                    continue
+                statistics.add(len(buffer), started, time.perf_counter())
+                if len(buffer) != stat.st_size:
+                    # the file changed since it was stat, the budget is kept for what is actually queued
+                    byte_budget.release(stat.st_size - len(buffer))
+                self._put(buffer_queue, (file_path, stat_key, buffer, None))
+            self._put(buffer_queue, _END)
+        except PipelineStopped:
+            return
+        except Exception as error:
+            # raised by run, which stops the other stages instead of waiting for the end of this reader
+            self._put_error(buffer_queue, error)
+
+    def _put_error(self, buffer_queue: queue.Queue, error: Exception):
+        try:
+            self._put(buffer_queue, (None, None, None, error))
+        except PipelineStopped:
+            pass
+
+    def get_statistics(self) -> str:
+        return f'Ingestion of {self.folder_path}: {self.scan_statistics}; {self.read_statistics} with {self.readers} ' \
+               f'threads; {self.hash_statistics} with {self.hash_workers} processes; {self.cached_files} files from the cache'
@@ -0,0 +1,204 @@
+import json
+import os
+import sys
+import threading
+import time
+import typing as t
+from contextlib import contextmanager, nullcontext
+
+
+class Progress:
+    """
+    Live progress of a phase on a stream, with the rate and, if the total is known, the remaining time. On a terminal
+    the line is rewritten in place every interval seconds, otherwise a new line is written every 10 intervals.
+    """
+
+    def __init__(self, name: str, total: t.Optional[int], unit: str, stream: t.TextIO, interval: float):
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.stream = stream
+        self.in_place = stream.isatty()
+        self.interval = interval if self.in_place else interval * 10
+        self.started = time.perf_counter()
+        self.next_update = self.started + self.interval
+
+    def set_total(self, total: int):
+        self.total = total
+
+    def advance(self, value: int = 1):
+        self.done += value
+        now = time.perf_counter()
+        if now >= self.next_update:
+            self.next_update = now + self.interval
+            self.show(now)
+
+    def show(self, now: float, end: str = ''):
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        message = f'{self.name}: {self.done:,}'
+        if self.total:
+            message += f'/{self.total:,} {self.unit} ({self.done / self.total:.0%})'
+        else:
+            message += f' {self.unit}'
+        message += f', {rate:,.0f} {self.unit}/s, {elapsed:.1f}s elapsed'
+        if self.total and rate and self.done < self.total:
+            message += f', {(self.total - self.done) / rate:.1f}s left'
+        if self.in_place:
+            self.stream.write(f'\r\033[K{message}{end}')
+        else:
+            self.stream.write(f'{message}\n')
+        self.stream.flush()
+
+    def finish(self):
+        self.show(time.perf_counter(), end='\n')
+
+    def __enter__(self) -> 'Progress':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finish()
+
+
+class _NoProgress:
+
+    def set_total(self, total: int):
+        pass
+
+    def advance(self, value: int = 1):
+        pass
+
+    def finish(self):
+        pass
+
+    def __enter__(self) -> '_NoProgress':
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class Instrumentation:
+    """
+    Wall time spent in every named phase of a run, summed over repeated phases, and counters of what was processed,
+    like pairs scored or cache hits. With trace, every phase and every change of a counter is kept as an event of
+    a Chrome trace, see write_chrome_trace. With progress, long phases show their progress on progress_stream.
+    """
+
+    def __init__(self, trace: bool = False, progress: bool = False, progress_stream: t.TextIO = None,
+                 progress_interval: float = 0.5):
+        self.seconds: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.trace_events: t.Optional[list[dict]] = [] if trace else None
+        self.show_progress = progress
+        self.progress_stream = progress_stream or sys.stderr
+        self.progress_interval = progress_interval
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str, **arguments) -> t.Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self.seconds[name] = self.seconds.get(name, 0.0) + finished - started
+                if self.trace_events is not None:
+                    self.trace_events.append({
+                        'name': name, 'ph': 'X', 'ts': (started - self.started) * 1e6, 'dur': (finished - started) * 1e6,
+                        'pid': os.getpid(), 'tid': threading.get_ident(), 'args': arguments,
+                    })
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+            if self.trace_events is not None:
+                self.trace_events.append({'name': name, 'ph': 'C', 'ts': (time.perf_counter() - self.started) * 1e6,
+                                          'pid': os.getpid(), 'args': {name: self.counts[name]}})
+
+    def progress(self, name: str, total: t.Optional[int] = None, unit: str = 'files') -> t.Union[Progress, _NoProgress]:
+        if not self.show_progress:
+            return _NO_PROGRESS
+        return Progress(name, total, unit, self.progress_stream, self.progress_interval)
+
+    def as_dict(self) -> dict:
+        return {'seconds': dict(self.seconds), 'counts': dict(self.counts)}
+
+    def get_summary(self) -> str:
+        total = time.perf_counter() - self.started
+        lines = [f'Phases of the run, {total:.2f}s in total:']
+        lines.extend(f'{seconds:10.3f}s {seconds / total if total else 0.0:6.1%}  {name}'
+                     for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]))
+        lines.append('Counters: ' + ', '.join(f'{value:,} {name}' for name, value in self.counts.items()))
+        return '\n'.join(lines)
+
+    def write_chrome_trace(self, trace_file: str):
+        """
+        Writes the trace events in the Chrome trace event format, to be opened in chrome://tracing or ui.perfetto.dev.
+        """
+        with open(trace_file, 'w') as file:
+            json.dump({'traceEvents': self.trace_events or [], 'displayTimeUnit': 'ms'}, file)
+
+
+# nothing is recorded unless an Instrumentation is activated, phase and progress then return shared objects doing
+# nothing: instrumented code costs a call and a None check, made once per phase or per batch of work, not per line
+_NO_PROGRESS = _NoProgress()
+_NO_PHASE = nullcontext()
+_active: t.Optional[Instrumentation] = None
+
+
+def activate(instrumentation: t.Optional[Instrumentation]):
+    """
+    Makes the module level functions record into instrumentation, None to stop recording.
+    """
+    global _active
+    _active = instrumentation
+
+
+def get_active() -> t.Optional[Instrumentation]:
+    return _active
+
+
+def phase(name: str, **arguments):
+    return _active.phase(name, **arguments) if _active else _NO_PHASE
+
+
+def count(name: str, value: int = 1):
+    if _active:
+        _active.count(name, value)
+
+
+def progress(name: str, total: t.Optional[int] = None, unit: str = 'files') -> t.Union[Progress, _NoProgress]:
+    return _active.progress(name, total, unit) if _active else _NO_PROGRESS
+
+
+@contextmanager
+def instrumented(summary: bool = False, progress: bool = False, trace_file: t.Optional[str] = None,
+                 profile_file: t.Optional[str] = None) -> t.Iterator[t.Optional[Instrumentation]]:
+    """
+    Instruments the code run within: prints the time of every phase and the counters at the end with summary,
+    shows progress, writes a Chrome trace to trace_file and cProfile statistics to profile_file, for pstats or snakeviz.
+    Nothing is activated if none of them is asked for.
+    """
+    instrumentation = Instrumentation(trace=bool(trace_file), progress=progress) if summary or progress or trace_file else None
+    previous = _active
+    activate(instrumentation or previous)
+    profile = None
+    if profile_file:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        yield instrumentation
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(profile_file)
+        activate(previous)
+        if instrumentation and trace_file:
+            instrumentation.write_chrome_trace(trace_file)
+        if instrumentation and summary:
+            print(instrumentation.get_summary())
@@ -0,0 +1,125 @@
+import typing as t
+
+import numpy as np
+
+from .comparator import Comparator, FileMeta
+
+
+class CandidateIndex:
+    """
+    Base of the indexes generating candidate pairs for a full comparison, every other pair is 0% similar.
+    Pictures, images fingerprinted with perceptual_image_matching, have no lines and are compared by their perceptual
+    hashes, see Comparator.get_picture_uniqueness_scores,
+    so pictures which are not entirely different are always candidates.
+    """
+
+    def __init__(self, file_metas: list[FileMeta]):
+        self.file_metas = file_metas
+        self.picture_files = np.array([i for i, file_meta in enumerate(file_metas) if file_meta.is_picture()], dtype=np.int64)
+        self.perceptual_hashes = np.array([file_metas[i].perceptual_hash for i in self.picture_files.tolist()], dtype=np.int64)
+
+    def add_similar_pictures(self, other: 'CandidateIndex', candidates: dict[tuple[int, int], int]):
+        if not len(other.picture_files):
+            return
+        for i, perceptual_hash in zip(self.picture_files.tolist(), self.perceptual_hashes.tolist()):
+            similar = other.picture_files[Comparator.get_picture_uniqueness_scores(perceptual_hash, other.perceptual_hashes) < 100]
+            for j in similar.tolist():
+                candidates.setdefault((i, j), 0)
+
+
+def get_frequent_line_hashes(file_metas: list[FileMeta], max_line_occurrences: t.Optional[int]) -> np.ndarray:
+    """
+    Sorted line hashes occurring in more than max_line_occurrences of file_metas, none without a maximum.
+    """
+    if max_line_occurrences is None or not file_metas:
+        return np.empty(0, dtype=np.int64)
+    line_hashes, occurrences = np.unique(np.concatenate([file_meta.get_hash_counts()[0] for file_meta in file_metas]),
+                                         return_counts=True)
+    return line_hashes[occurrences > max_line_occurrences]
+
+
+class LineHashIndex(CandidateIndex):
+    """
+    Inverted index from a line content hash to the files containing that line.
+    Used to generate candidate pairs for a full comparison: two files that do not share
+    a single line are 0% similar, so there is no need to compare them.
+    The files containing line_hashes[k] are files[offsets[k]:offsets[k + 1]], in ascending order.
+    """
+
+    def __init__(self, file_metas: list[FileMeta]):
+        super().__init__(file_metas)
+        file_hashes = [file_meta.get_hash_counts()[0] for file_meta in file_metas]
+        hashes = np.concatenate(file_hashes) if file_hashes else np.empty(0, dtype=np.int64)
+        file_ids = np.repeat(np.arange(len(file_metas)), [len(line_hashes) for line_hashes in file_hashes])
+        order = np.argsort(hashes, kind='stable')
+        self.line_hashes, occurrences = np.unique(hashes[order], return_counts=True)
+        self.offsets = np.concatenate(([0], np.cumsum(occurrences)))
+        self.files = file_ids[order]
+
+    def get_occurrences(self) -> np.ndarray:
+        """
+        Number of files containing each of line_hashes.
+        """
+        return np.diff(self.offsets)
+
+    def get_files_of(self, hash_positions: np.ndarray) -> np.ndarray:
+        """
+        The concatenated posting lists of line_hashes[hash_positions], a file once for every line it contains.
+        """
+        starts = self.offsets[hash_positions]
+        lengths = self.offsets[hash_positions + 1] - starts
+        ends = np.cumsum(lengths)
+        return self.files[np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)]
+
+    def get_candidate_pairs(self, other: 'LineHashIndex', min_shared_lines: int = 1,
+                            max_line_occurrences: t.Optional[int] = None) -> dict[tuple[int, int], int]:
+        """
+        Returns {(index in self, index in other): number of distinct shared lines} for every pair
+        sharing at least min_shared_lines lines, plus similar pictures.
+        Lines in more than max_line_occurrences files of either side, like boilerplate, are not counted.
+        Shared lines are counted file by file of self, from the posting lists of other, without listing the pairs
+        of files sharing fewer lines.
+        """
+        # position in other.line_hashes of every line hash of self, -1 if other has not got it
+        _, positions, other_positions = np.intersect1d(self.line_hashes, other.line_hashes, assume_unique=True,
+                                                       return_indices=True)
+        if max_line_occurrences is not None:
+            counted = (self.get_occurrences()[positions] <= max_line_occurrences) \
+                & (other.get_occurrences()[other_positions] <= max_line_occurrences)
+            positions, other_positions = positions[counted], other_positions[counted]
+        position_in_other = np.full(len(self.line_hashes), -1, dtype=np.int64)
+        position_in_other[positions] = other_positions
+
+        min_shared_lines = max(min_shared_lines, 1)
+        candidates = {}
+        for i, file_meta in enumerate(self.file_metas):
+            shared_positions = position_in_other[np.searchsorted(self.line_hashes, file_meta.get_hash_counts()[0])]
+            shared_positions = shared_positions[shared_positions >= 0]
+            if len(shared_positions) < min_shared_lines:
+                continue
+            shared_lines = np.bincount(other.get_files_of(shared_positions), minlength=len(other.file_metas))
+            others = np.flatnonzero(shared_lines >= min_shared_lines)
+            candidates.update(zip(zip([i] * len(others), others.tolist()), shared_lines[others].tolist()))
+        self.add_similar_pictures(other, candidates)
+        return candidates
+
+
+class SharedLineHashIndex:
+    """
+    The line hash indexes of the files of several repositories, so that every repository is ingested and
+    indexed once and the candidate pairs of all repository pairs come from the same indexes.
+    """
+
+    def __init__(self, repository_file_metas: list[list[FileMeta]]):
+        self.repository_file_metas = repository_file_metas
+        self.indexes = [LineHashIndex(file_metas) for file_metas in repository_file_metas]
+
+    def get_candidate_pairs(self, min_shared_lines: int = 1, max_line_occurrences: t.Optional[int] = None
+                            ) -> dict[tuple[int, int], dict[tuple[int, int], int]]:
+        """
+        Returns {(repository a, repository b): candidate pairs of a against b} for every a < b, the candidate pairs
+        as LineHashIndex.get_candidate_pairs returns them for the two repositories.
+        """
+        repository_count = len(self.repository_file_metas)
+        return {(a, b): self.indexes[a].get_candidate_pairs(self.indexes[b], min_shared_lines, max_line_occurrences)
+                for a in range(repository_count) for b in range(a + 1, repository_count)}
@@ -0,0 +1,350 @@
+import heapq
+from collections import defaultdict
+from typing import Iterable
+
+import numpy as np
+
+# A scored candidate pair: (index of the first file, index of the second file, similarity in percent).
+# Pairs which are not listed are considered 0% similar.
+ScoredPair = tuple[int, int, int]
+
+MUTUAL_BEST = 'mutual_best'
+OPTIMAL = 'optimal'
+
+# optimal matching of components with at least this share of their possible pairs scored, and at most this many
+# possible pairs, 8 bytes each, runs on a dense similarity matrix, which is faster unless the scored pairs are few
+dense_matching_min_density = 1 / 128
+dense_matching_max_cells = 2 ** 23
+
+
+def match_mutual_best(scored_pairs: Iterable[ScoredPair], similarity_lower_bound: int) -> list[tuple[int, int]]:
+    """
+    Pairs files which are each other's most similar file, the same way the former row/column scan of the
+    comparison matrix did: ties are broken by the lower index, only pairs more similar than
+    similarity_lower_bound are accepted, and the matches are returned in the order the scan accepted them
+    (always the lowest first index that is a mutual best at that moment).
+
+    Every row and column keeps a pointer into its candidates sorted once by similarity, a pointer only moves
+    forward when its current best gets matched, and mutual bests wait in a heap keyed by the first index.
+    Complexity: O(P log P) time and O(P) memory for P scored pairs, independent of the number of files.
+    """
+    row_candidates: dict[int, list[tuple[int, int]]] = defaultdict(list)
+    column_candidates: dict[int, list[tuple[int, int]]] = defaultdict(list)
+    for i, j, pair_similarity in scored_pairs:
+        # pairs at or below the bound can never be accepted and never outrank a pair that can
+        if pair_similarity > similarity_lower_bound:
+            row_candidates[i].append((-pair_similarity, j))
+            column_candidates[j].append((-pair_similarity, i))
+    for candidates in row_candidates.values():
+        candidates.sort()
+    for candidates in column_candidates.values():
+        candidates.sort()
+
+    matched_rows = set()
+    matched_columns = set()
+    row_pointer = dict.fromkeys(row_candidates, 0)
+    column_pointer = dict.fromkeys(column_candidates, 0)
+    rows_pointing_to: dict[int, list[int]] = defaultdict(list)
+    columns_pointing_to: dict[int, list[int]] = defaultdict(list)
+
+    def best_column(i):
+        candidates = row_candidates[i]
+        pointer = row_pointer[i]
+        while pointer < len(candidates) and candidates[pointer][1] in matched_columns:
+            pointer += 1
+        row_pointer[i] = pointer
+        return candidates[pointer][1] if pointer < len(candidates) else None
+
+    def best_row(j):
+        candidates = column_candidates[j]
+        pointer = column_pointer[j]
+        while pointer < len(candidates) and candidates[pointer][1] in matched_rows:
+            pointer += 1
+        column_pointer[j] = pointer
+        return candidates[pointer][1] if pointer < len(candidates) else None
+
+    ready_rows = []
+
+    def refresh_row(i):
+        j = best_column(i)
+        if j is not None:
+            rows_pointing_to[j].append(i)
+            if best_row(j) == i:
+                heapq.heappush(ready_rows, i)
+
+    def refresh_column(j):
+        i = best_row(j)
+        if i is not None:
+            columns_pointing_to[i].append(j)
+            if best_column(i) == j:
+                heapq.heappush(ready_rows, i)
+
+    for j in column_candidates:
+        refresh_column(j)
+    for i in row_candidates:
+        j = best_column(i)
+        if j is not None:
+            rows_pointing_to[j].append(i)
+
+    matches = []
+    while ready_rows:
+        i = heapq.heappop(ready_rows)
+        if i in matched_rows:
+            continue
+        j = best_column(i)
+        if j is None or best_row(j) != i:
+            continue
+        matches.append((i, j))
+        matched_rows.add(i)
+        matched_columns.add(j)
+        # only rows that pointed at j and columns that pointed at i lose their current best
+        for other_i in rows_pointing_to.pop(j, []):
+            if other_i not in matched_rows:
+                refresh_row(other_i)
+        for other_j in columns_pointing_to.pop(i, []):
+            if other_j not in matched_columns:
+                refresh_column(other_j)
+    return matches
+
+
+def match_optimal(scored_pairs: Iterable[ScoredPair], similarity_lower_bound: int) -> list[tuple[int, int]]:
+    """
+    Pairs files so that the sum of similarities of all accepted pairs is maximal, using only pairs more similar
+    than similarity_lower_bound, separately for every connected component of the candidate graph.
+    Components with many of their possible pairs scored are solved with the Hungarian algorithm on a dense matrix,
+    the others as a min-cost flow with successive shortest paths (Dijkstra with potentials) on the sparse candidate
+    graph. After every Dijkstra all the shortest augmenting paths are augmented along, so the integer cost of the
+    shortest path grows with every Dijkstra and a component needs at most 101 of them.
+    Complexity of the sparse flow: O(P_c log P_c) per Dijkstra and O(P_c) per search for further shortest paths,
+    with P_c scored pairs of a component, O(P) memory.
+    Matches are returned ordered by the first index.
+    """
+    matches = []
+    for component_edges in get_components(scored_pairs, similarity_lower_bound):
+        matches.extend(_max_weight_matching(component_edges))
+    return sorted(matches)
+
+
+def get_components(scored_pairs: Iterable[ScoredPair], similarity_lower_bound: int) -> list[list[ScoredPair]]:
+    """
+    Splits the pairs more similar than similarity_lower_bound into connected components of the candidate graph.
+    Both matching modes pair the files of a component independently of every other component.
+    """
+    edges = [(i, j, pair_similarity) for i, j, pair_similarity in scored_pairs if pair_similarity > similarity_lower_bound]
+
+    parent = {}
+
+    def find(node):
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for i, j, _ in edges:
+        parent[find((0, i))] = find((1, j))
+
+    components: dict[tuple, list[ScoredPair]] = defaultdict(list)
+    for edge in edges:
+        components[find((0, edge[0]))].append(edge)
+    return list(components.values())
+
+
+def merge_component_matches(component_matches: Iterable[list[tuple[int, int]]]) -> list[tuple[int, int]]:
+    """
+    Merges the matches of separately matched components into the order match() returns for all pairs at once:
+    the next match is always the head with the lowest first index, which is the mutual best acceptance order and
+    the first index order of the optimal mode alike.
+    """
+    component_matches = list(component_matches)
+    heads = [(matches[0][0], nr, 0) for nr, matches in enumerate(component_matches) if matches]
+    heapq.heapify(heads)
+    merged = []
+    while heads:
+        _, nr, position = heapq.heappop(heads)
+        merged.append(component_matches[nr][position])
+        if position + 1 < len(component_matches[nr]):
+            heapq.heappush(heads, (component_matches[nr][position + 1][0], nr, position + 1))
+    return merged
+
+
+def _max_weight_matching(edges: list[ScoredPair]) -> list[tuple[int, int]]:
+    rows = sorted({i for i, _, _ in edges})
+    columns = sorted({j for _, j, _ in edges})
+    if len(edges) == 1 or len(rows) == 1 or len(columns) == 1:
+        i, j, _ = min(edges, key=lambda edge: (-edge[2], edge[0], edge[1]))
+        return [(i, j)]
+    cells = len(rows) * len(columns)
+    if cells <= dense_matching_max_cells and len(edges) >= cells * dense_matching_min_density:
+        return _max_weight_matching_dense(edges, rows, columns)
+    return _max_weight_matching_sparse(edges, rows, columns)
+
+
+def _max_weight_matching_dense(edges: list[ScoredPair], rows: list[int], columns: list[int]) -> list[tuple[int, int]]:
+    """
+    The Hungarian algorithm with shortest augmenting paths on the matrix of negated similarities, pairs which are
+    not scored being 0% similar like unmatched files, vectorized over the columns.
+    Complexity: O(n^2 m) time and O(n m) memory for n <= m rows and columns, usually far less time.
+    """
+    edge_array = np.array(edges, dtype=np.int64)
+    costs = np.zeros((len(rows), len(columns)))
+    costs[np.searchsorted(rows, edge_array[:, 0]), np.searchsorted(columns, edge_array[:, 1])] = -edge_array[:, 2]
+    transposed = len(rows) > len(columns)
+    if transposed:
+        costs = costs.T
+    n, m = costs.shape
+
+    # 1-based potentials u of the rows and v of the columns, column 0 is the one the row being added starts from,
+    # matched_row[j] the row column j is assigned to, 0 if none
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    matched_row = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        matched_row[0] = i
+        j0 = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = matched_row[j0]
+            slack = costs[i0 - 1] - u[i0] - v[1:]
+            improved = ~used[1:] & (slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            way[1:][improved] = j0
+            free_slack = np.where(used[1:], np.inf, min_slack[1:])
+            j1 = int(np.argmin(free_slack)) + 1
+            delta = free_slack[j1 - 1]
+            u[matched_row[used]] += delta
+            v[used] -= delta
+            min_slack[~used] -= delta
+            j0 = j1
+            if matched_row[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            matched_row[j0] = matched_row[j1]
+            j0 = j1
+
+    matches = []
+    for j, i in enumerate(matched_row[1:].tolist()):
+        # rows assigned to a pair which is not scored stay unmatched
+        if i and costs[i - 1, j] < 0:
+            matches.append((rows[j], columns[i - 1]) if transposed else (rows[i - 1], columns[j]))
+    return sorted(matches)
+
+
+def _max_weight_matching_sparse(edges: list[ScoredPair], rows: list[int], columns: list[int]) -> list[tuple[int, int]]:
+    """
+    Min-cost flow with successive shortest paths on the residual graph of the scored pairs.
+    """
+    # nodes: 0 source, 1..n rows, n+1..n+m columns, n+m+1 sink
+    row_node = {i: node for node, i in enumerate(rows, start=1)}
+    column_node = {j: node for node, j in enumerate(columns, start=len(rows) + 1)}
+    source, sink = 0, len(rows) + len(columns) + 1
+    graph: list[list[list[int]]] = [[] for _ in range(sink + 1)]  # edge: [to, capacity, cost, reverse index]
+
+    def add_edge(u, v, cost):
+        graph[u].append([v, 1, cost, len(graph[v])])
+        graph[v].append([u, 0, -cost, len(graph[u]) - 1])
+
+    for i in rows:
+        add_edge(source, row_node[i], 0)
+    for i, j, pair_similarity in sorted(edges):
+        add_edge(row_node[i], column_node[j], -pair_similarity)
+    for j in columns:
+        add_edge(column_node[j], sink, 0)
+
+    # initial potentials, the residual graph is a DAG source -> rows -> columns -> sink
+    potential = [0] * (sink + 1)
+    for j in columns:
+        potential[column_node[j]] = min(-cost for to, capacity, cost, _ in graph[column_node[j]] if to != sink)
+    potential[sink] = min(potential[column_node[j]] for j in columns)
+
+    infinity = float('inf')
+    while True:
+        distance = [infinity] * (sink + 1)
+        distance[source] = 0
+        queue = [(0, source)]
+        while queue:
+            dist, u = heapq.heappop(queue)
+            if u == sink:
+                # the nodes not settled yet are capped at the sink distance below anyway
+                break
+            if dist > distance[u]:
+                continue
+            for v, capacity, cost, _ in graph[u]:
+                if capacity == 0:
+                    continue
+                new_distance = dist + cost + potential[u] - potential[v]
+                if new_distance < distance[v]:
+                    distance[v] = new_distance
+                    heapq.heappush(queue, (new_distance, v))
+        if distance[sink] == infinity:
+            break
+        # capping at the sink distance keeps reduced costs non-negative for nodes Dijkstra did not reach
+        for node in range(sink + 1):
+            potential[node] += min(distance[node], distance[sink])
+        # potential[sink] is now the real cost of the shortest augmenting paths, stop once it stops gaining
+        if potential[sink] - potential[source] >= 0:
+            break
+        # every path of edges with a reduced cost of 0 is a shortest one, augment along all of them before the
+        # next Dijkstra: the costs of the shortest paths only grow, so there are at most 101 Dijkstras
+        while _augment_shortest_paths(graph, potential, source, sink):
+            pass
+
+    column_of_node = {node: j for j, node in column_node.items()}
+    return [(i, column_of_node[to])
+            for i in rows
+            for to, capacity, cost, _ in graph[row_node[i]]
+            if to in column_of_node and capacity == 0]
+
+
+def _augment_shortest_paths(graph: list[list[list[int]]], potential: list[int], source: int, sink: int) -> int:
+    """
+    Augments along node disjoint paths from source to sink of edges with a reduced cost of 0, found by a depth first
+    search visiting every node once, and returns how many there were.
+    """
+    visited = [False] * len(graph)
+    next_edge = [0] * len(graph)
+    path = [source]
+    path_edges = []
+    augmented = 0
+    while path:
+        u = path[-1]
+        if u == sink:
+            for u, edge_index in zip(path, path_edges):
+                edge = graph[u][edge_index]
+                edge[1] -= 1
+                graph[edge[0]][edge[3]][1] += 1
+            augmented += 1
+            path = [source]
+            path_edges = []
+            continue
+        edges = graph[u]
+        edge_index = next_edge[u]
+        u_potential = potential[u]
+        while edge_index < len(edges):
+            v, capacity, cost, _ = edges[edge_index]
+            if capacity and not visited[v] and cost + u_potential == potential[v]:
+                break
+            edge_index += 1
+        next_edge[u] = edge_index
+        if edge_index < len(edges):
+            # the sink is reached by every path
+            visited[v] = v != sink
+            path.append(v)
+            path_edges.append(edge_index)
+        else:
+            # a dead end, not visited again
+            path.pop()
+            if path_edges:
+                path_edges.pop()
+    return augmented
+
+
+def match(scored_pairs: Iterable[ScoredPair], similarity_lower_bound: int, mode: str = MUTUAL_BEST) -> list[tuple[int, int]]:
+    if mode == MUTUAL_BEST:
+        return match_mutual_best(scored_pairs, similarity_lower_bound)
+    if mode == OPTIMAL:
+        return match_optimal(scored_pairs, similarity_lower_bound)
+    raise ValueError(f"Unknown matching mode {mode}, expected {MUTUAL_BEST} or {OPTIMAL}")
@@ -0,0 +1,76 @@
+from collections import defaultdict
+
+import numpy as np
+
+from .comparator import FileMeta
+from .line_index import CandidateIndex
+
+# odd 64 bit constant to tell apart repeated occurrences of the same line
+_OCCURRENCE_SALT = np.uint64(0x9E3779B97F4A7C15)
+_CHUNK_SIZE = 4096
+
+
+class MinHashIndex(CandidateIndex):
+    """
+    Approximate candidate generation for large or many repositories, where common boilerplate lines make the
+    exact LineHashIndex propose too many pairs.
+
+    Every file gets a MinHash signature of its line hash multiset (the n-th occurrence of a line is a distinct
+    element), whose slots agree with the probability of the weighted Jaccard similarity of two files, which is
+    close to the similarity of a FileComparison. The signature is cut into bands of permutations // bands
+    values, and files sharing any band become candidates. A pair with Jaccard similarity s is proposed with
+    probability 1 - (1 - s ** rows) ** bands, the default 256 permutations in 128 bands of 2 rows propose
+    a 10% similar pair with 72%, a 20% similar pair with 99.5% and a 30% similar pair with 99.9994% probability.
+    Candidates are approximate all the same, pairs the exact index would match can be missed, see
+    benchmarks/minhash_recall.py.
+    """
+
+    def __init__(self, file_metas: list[FileMeta], permutations: int = 256, bands: int = 128, seed: int = 1):
+        if permutations % bands:
+            raise ValueError(f"permutations ({permutations}) must be a multiple of bands ({bands})")
+        super().__init__(file_metas)
+        self.bands = bands
+        self.rows = permutations // bands
+        random = np.random.default_rng(seed)
+        self.multipliers = random.integers(1, 2 ** 63, size=permutations, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.increments = random.integers(0, 2 ** 63, size=permutations, dtype=np.uint64)
+
+        self.buckets: dict[tuple[int, bytes], list[int]] = defaultdict(list)
+        for file_index, file_meta in enumerate(file_metas):
+            # files without lines share nothing, their signatures would all be equal
+            if file_meta.line_count == 0:
+                continue
+            signature = self.get_signature(file_meta)
+            for band in range(bands):
+                self.buckets[(band, signature[band * self.rows:(band + 1) * self.rows].tobytes())].append(file_index)
+
+    def get_signature(self, file_meta: FileMeta) -> np.ndarray:
+        unique_hashes, hash_counts = file_meta.get_hash_counts()
+        elements = np.repeat(unique_hashes.view(np.uint64), hash_counts)
+        occurrences = np.arange(len(elements), dtype=np.uint64) - np.repeat(np.cumsum(hash_counts) - hash_counts, hash_counts).astype(np.uint64)
+        elements = elements + occurrences * _OCCURRENCE_SALT
+
+        signature = np.full(len(self.multipliers), np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(elements), _CHUNK_SIZE):
+            permuted = elements[start:start + _CHUNK_SIZE, None] * self.multipliers + self.increments
+            permuted ^= permuted >> np.uint64(29)
+            np.minimum(signature, permuted.min(axis=0), out=signature)
+        return signature
+
+    def get_candidate_pairs(self, other: 'MinHashIndex') -> dict[tuple[int, int], int]:
+        """
+        Returns {(index in self, index in other): number of shared bands} for every pair sharing a band,
+        plus similar pictures. Both indexes must use the same permutations, bands and seed.
+        """
+        candidates = defaultdict(int)
+        for bucket, first_files in self.buckets.items():
+            second_files = other.buckets.get(bucket)
+            if not second_files:
+                continue
+            for i in first_files:
+                for j in second_files:
+                    candidates[(i, j)] += 1
+
+        candidates = dict(candidates)
+        self.add_similar_pictures(other, candidates)
+        return candidates
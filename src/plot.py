@@ -1,17 +1,27 @@
-import matplotlib.pyplot as plt
-from .comparator import FileComparison
-import numpy as np
+from .similarity_histogram import SimilarityHistogram
 
 
-def plot_similarity_bar_chart(numbers: list[int], title: str, save_to_file_path: str = None):
-    plt.figure()
-    bins = np.arange(0, 101, 5)
-    plt.hist(numbers, bins=bins)
-    plt.title(title)
-    plt.xlabel('File Similarity')
-    plt.ylabel('Count')
+def plot_similarity_bar_chart(histogram: SimilarityHistogram, title: str, save_to_file_path: str = None):
+    """
+    Draws the counts of the histogram in 5% bins. Saved charts are rendered by a figure of its own on the Agg canvas,
+    without pyplot and its global figures, only showing a chart needs an interactive backend.
+    """
+    # matplotlib is imported only when a chart is drawn
+    if save_to_file_path:
+        from matplotlib.figure import Figure
+        figure = Figure()
+    else:
+        import matplotlib.pyplot as plt
+        figure = plt.figure()
+    axes = figure.subplots()
+    edges, bin_counts = histogram.get_bins(5)
+    axes.bar(edges[:-1], bin_counts, width=edges[1:] - edges[:-1], align='edge')
+    axes.set_title(title)
+    axes.set_xlabel('File Similarity')
+    axes.set_ylabel('Count')
 
     if save_to_file_path:
-        plt.savefig(save_to_file_path)
+        figure.savefig(save_to_file_path)
     else:
         plt.show()
+        plt.close(figure)
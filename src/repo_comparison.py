@@ -1,83 +1,67 @@
 import os
 import filecmp
 import hashlib
+import typing as t
 from collections import defaultdict
+from itertools import combinations
+from . import comparator, instrumentation
+from .clones import CloneDetector
 from .comparator import Comparator, FileMeta, FileComparison, LineMeta
-from .plot import plot_similarity_bar_chart
+from .export import StructuredReportSink, JSONL, PARQUET
+from .fingerprint_cache import FingerprintCache
+from .incremental import ComparisonState, score_and_match_incrementally
+from .line_index import LineHashIndex, SharedLineHashIndex
+from .matching import match, MUTUAL_BEST, OPTIMAL
+from .minhash import MinHashIndex
+from .report import MarkdownReportSink, format_file_path, md_indent, write_clone_report
+from .results import ComparisonResult, MatchedPair
+from .similarity_histogram import SimilarityHistogram
 
 
 european_root = './resources/european'
 asia_root = './resources/asia'
+# name -> root of every repository of an N-way comparison, each pair is reported in ./report/<name>_<name>,
+# empty to compare european_root with asia_root
+repository_roots: dict[str, str] = {}
+similarity_matrix_file = './report/similarity_matrix.md'
 duplicated_report_file = './report/duplicated.md'
 partially_duplicated_report_file = './report/partially_duplicated.md'
 partially_duplicated_detailed_report_file = './report/partially_duplicated_detailed.md'
 fully_unique_files = './report/unique.md'
+clone_report_file = './report/copied_blocks.md'
+markdown_reports = True  # False to write no markdown report, the results are returned either way
+structured_report_formats = []  # JSONL and/or PARQUET, one record per matched pair and unique file
+structured_report_line_ranges = False  # add the line ranges of the duplicated lines to every record
+max_buffered_report_pairs = 10000  # partially duplicated pairs kept in memory before they are sorted on disk
 similarity_bar_chart_picture_directory = './report'
+plot_similarity_bar_charts = True  # matplotlib is not imported without the charts
+fingerprint_cache_file = './cache/fingerprints.sqlite'  # None to always hash every file
+invalidate_fingerprint_cache = False
+fingerprint_cache_match_content_hash = False  # serve files whose stat changed but whose content is cached, reading them
+fingerprint_cache_max_age_days = 30  # entries unused for longer are evicted after a run, None to keep them
+incremental_state_file = './cache/comparison_state.pickle'  # None to score every candidate pair on each run
+
+LINE_INDEX = 'line_index'
+MINHASH = 'minhash'
 
 similarity = 80
 similarity_lower_bound = 10  # files that are < 10 similar are considered different
-
-md_indent = '&nbsp;&nbsp;&nbsp;&nbsp;' \
-            ''
-def format_file_path(file_path):
-    return f'[{file_path}](../{file_path})'
-
-
-def write_report_full_duplicates(duplicated_files: list[FileComparison]):
-    with open(duplicated_report_file, "w+") as f_dup:
-        msg = f'Found {len(duplicated_files)} fully identical files\n\n'
-        print(msg.replace('\n', ''))
-        f_dup.write(msg)
-        for file_comparison in duplicated_files:
-            f_dup.write(f'Identical files found:\\\n')
-            f_dup.write(f'\t{md_indent}{format_file_path(file_comparison.first_file_meta.file_path)}\\\n')
-            #f_dup.write(f'\t{file_comparison.first_file_meta.file_path}\n')
-            f_dup.write(f'\t{md_indent}{format_file_path(file_comparison.second_file_meta.file_path)}\n\n')
-
-
-def write_report_partial_duplicates(partially_duplicated_files: list[FileComparison]):
-    partially_duplicated_files = sorted(partially_duplicated_files, key=lambda fc: fc.uniqueness_score)
-
-    msg = f'Found {len(partially_duplicated_files)} partially duplicated files:\n\n'
-    print(msg.replace('\n', ''))
-
-    def create_header(file_comparison: FileComparison):
-        return f'Partially similar files found. First length {len(file_comparison.first_file_meta.line_metas)}, '\
-               f'Second length {len(file_comparison.second_file_meta.line_metas)},  '\
-               f'The files are {100 - file_comparison.uniqueness_score}% identical'\
-               f'The files differ in {max(len(file_comparison.unique_in_first), len(file_comparison.unique_in_second))} lines:\\\n'
-
-    def create_diff_line_with_line_nr(file_meta: LineMeta):
-        return f'\t\t{md_indent*2}{file_meta.line_nr}\t| {file_meta.content}\\\n'
-
-
-    with open(partially_duplicated_report_file, "w+") as f_part_dup:
-        f_part_dup.write(msg)
-        for file_comparison in partially_duplicated_files:
-            f_part_dup.write(create_header(file_comparison))
-            if file_comparison.first_file_meta.file_name != file_comparison.second_file_meta.file_name:
-                f_part_dup.write('File names differ\\\n')
-            f_part_dup.write(f'\t{md_indent}{format_file_path(file_comparison.first_file_meta.file_path)}\\\n')
-            f_part_dup.write(f'\t{md_indent}{format_file_path(file_comparison.second_file_meta.file_path)} \n\n')
-
-    with open(partially_duplicated_detailed_report_file, "w+") as f_part_dup_detailed:
-        f_part_dup_detailed.write(msg)
-        for file_comparison in partially_duplicated_files:
-            f_part_dup_detailed.write(create_header(file_comparison))
-            f_part_dup_detailed.write(f'\t{md_indent}{format_file_path(file_comparison.first_file_meta.file_path)}\\\n')
-            f_part_dup_detailed.write(f'\t{md_indent}{format_file_path(file_comparison.second_file_meta.file_path)}\\\n')
-
-            f_part_dup_detailed.write(f'\t{md_indent}Unique lines in first:\\\n')
-            for first_line_meta in sorted(file_comparison.unique_in_first, key=lambda line_meta: line_meta.line_nr):
-                f_part_dup_detailed.write(create_diff_line_with_line_nr(first_line_meta))
-            f_part_dup_detailed.write(f'\t{md_indent}Unique lines in second:\\\n')
-            for second_line_meta in sorted(file_comparison.unique_in_second, key=lambda line_meta: line_meta.line_nr):
-                f_part_dup_detailed.write(create_diff_line_with_line_nr(second_line_meta))
-            f_part_dup_detailed.write(f'\n\n')
-
-
-def write_report_unique_files(fully_unique_first: list[FileMeta], fully_unique_second: list[FileMeta]):
-    with open(fully_unique_files, 'w+') as f_unique:
+similarity_threshold = 50  # the share of files more similar than this is printed after a comparison
+matching_mode = MUTUAL_BEST  # or OPTIMAL to maximize the overall similarity of all matched pairs
+min_shared_lines = 1  # pairs sharing fewer distinct lines are not compared and considered 0% similar
+max_line_occurrences = None  # e.g. 100, lines in more files of one side are boilerplate and do not make pairs candidates
+candidate_generation = LINE_INDEX  # or MINHASH to only compare pairs that are likely similar, approximate
+minhash_permutations = 256  # in 128 bands, no matched pair is lost on ./resources, see report/minhash_recall.md
+minhash_bands = 128
+clone_min_lines = 5  # shortest run of consecutive lines reported as a copied block, 0 to skip clone detection
+clone_max_window_occurrences = 100  # blocks repeated more often on one side are boilerplate and not reported
+phase_summary = False  # print the time spent in every phase of a run and its counters at the end
+show_progress = False  # live progress and remaining time of the long phases on stderr
+trace_file = None  # e.g. './report/trace.json', Chrome trace of the phases of a run for chrome://tracing or Perfetto
+profile_file = None  # e.g. './report/run.prof', cProfile statistics of a run for pstats or snakeviz
+
+def write_report_unique_files(fully_unique_first: list[FileMeta], fully_unique_second: list[FileMeta], report_file: str = None):
+    with open(report_file or fully_unique_files, 'w+') as f_unique:
         msg_1 = f'Found {len(fully_unique_first)} 100% unique files for the european repository\\\n'
         # msg_2 = f'Found {len(fully_unique_second)} 100% unique files for second'
         print(msg_1.replace('\n', ''))
@@ -86,7 +70,7 @@ def write_report_unique_files(fully_unique_first: list[FileMeta], fully_unique_s
         # f_unique.write(msg_2)
         f_unique.write('<br/><br/><br/><br/>\n')
         for first_file_meta in fully_unique_first:
-            f_unique.write(f'{md_indent}{len(first_file_meta.line_metas)} lines \t\t {format_file_path(first_file_meta.file_path)}\\\n')
+            f_unique.write(f'{md_indent}{first_file_meta.line_count} lines \t\t {format_file_path(first_file_meta.file_path)}\\\n')
         # f_unique.write('<br/><br/><br/><br/>\n')
         # for second_file_meta in fully_unique_second:
         #     f_unique.write(f'{md_indent}{len(second_file_meta.line_metas)} lines \t\t {format_file_path(second_file_meta.file_path)}\\\n')
@@ -94,83 +78,222 @@ def write_report_unique_files(fully_unique_first: list[FileMeta], fully_unique_s
 
 
 
-def traverse_directories(first, second):
-    first_file_metas_list = Comparator.create_file_metas_for_folder(first)
-    second_file_metas_list = Comparator.create_file_metas_for_folder(second)
+def open_fingerprint_cache():
+    fingerprint_cache = FingerprintCache(fingerprint_cache_file, fingerprint_cache_match_content_hash,
+                                         Comparator.get_fingerprint_settings()) if fingerprint_cache_file else None
+    if fingerprint_cache and invalidate_fingerprint_cache:
+        fingerprint_cache.invalidate()
+    return fingerprint_cache
+
+
+def close_fingerprint_cache(fingerprint_cache: FingerprintCache):
+    # entries of this run have just been used, what is evicted belongs to folders no longer compared
+    if fingerprint_cache_max_age_days is not None:
+        fingerprint_cache.evict_unused(fingerprint_cache_max_age_days * 24 * 60 * 60)
+    fingerprint_cache.close()
+
+
+def traverse_directories(first, second, report_directory: str = None) -> ComparisonResult:
+    with instrumentation.phase('ingestion'):
+        fingerprint_cache = open_fingerprint_cache()
+        first_file_metas_list = Comparator.create_file_metas_for_folder(first, cache=fingerprint_cache)
+        second_file_metas_list = Comparator.create_file_metas_for_folder(second, cache=fingerprint_cache)
+        if fingerprint_cache:
+            close_fingerprint_cache(fingerprint_cache)
     print(f'{len(first_file_metas_list)} files found in {first}')
     print(f'{len(second_file_metas_list)} files found in {second}')
 
+    result = compare_repositories(first, second, first_file_metas_list, second_file_metas_list, report_directory)
+    if fingerprint_cache:
+        print(fingerprint_cache.get_statistics())
+    return result
+
+
+def traverse_repositories(roots: dict[str, str]) -> dict[tuple[str, str], ComparisonResult]:
+    """
+    N-way comparison: every repository is ingested once and all of them go into one shared candidate index,
+    then every pair of repositories is compared and reported into its own report directory.
+    Writes the repository by repository similarity matrix and returns the result of every pair of names.
+    """
+    names = list(roots)
+    fingerprint_cache = open_fingerprint_cache()
+    repository_file_metas = []
+    for name in names:
+        with instrumentation.phase('ingestion'):
+            repository_file_metas.append(Comparator.create_file_metas_for_folder(roots[name], cache=fingerprint_cache))
+        print(f'{len(repository_file_metas[-1])} files found in {roots[name]}')
+    if fingerprint_cache:
+        close_fingerprint_cache(fingerprint_cache)
+
+    repository_pairs = list(combinations(range(len(names)), 2))
+    with instrumentation.phase('candidates'):
+        if candidate_generation == MINHASH:
+            minhash_indexes = [MinHashIndex(file_metas, minhash_permutations, minhash_bands) for file_metas in repository_file_metas]
+            candidate_pairs = {(a, b): minhash_indexes[a].get_candidate_pairs(minhash_indexes[b]) for a, b in repository_pairs}
+        else:
+            candidate_pairs = SharedLineHashIndex(repository_file_metas).get_candidate_pairs(min_shared_lines, max_line_occurrences)
+
+    similarity_matrix = [[100 if a == b else 0 for b in range(len(names))] for a in range(len(names))]
+    results = {}
+    for a, b in repository_pairs:
+        print(f'Comparing {names[a]} with {names[b]}')
+        report_directory = os.path.join(similarity_bar_chart_picture_directory, f'{names[a]}_{names[b]}')
+        if markdown_reports or structured_report_formats or plot_similarity_bar_charts:
+            os.makedirs(report_directory, exist_ok=True)
+        results[(names[a], names[b])] = compare_repositories(
+            roots[names[a]], roots[names[b]], repository_file_metas[a], repository_file_metas[b],
+            report_directory, candidate_pairs[(a, b)]
+        )
+        similarity_matrix[a][b] = similarity_matrix[b][a] = results[(names[a], names[b])].mean_similarity
+    if markdown_reports:
+        write_similarity_matrix(similarity_matrix_file, names, similarity_matrix)
+    if fingerprint_cache:
+        print(fingerprint_cache.get_statistics())
+    return results
+
+
+def write_similarity_matrix(matrix_file: str, names: list[str], similarity_matrix: list[list[float]]):
+    with open(matrix_file, 'w+') as f_matrix:
+        f_matrix.write('Mean similarity of the files of two repositories in percent, files without a match count as 0%\n\n')
+        f_matrix.write(f'| | {" | ".join(names)} |\n')
+        f_matrix.write(f'|---|{"---|" * len(names)}\n')
+        for name, row in zip(names, similarity_matrix):
+            f_matrix.write(f'| {name} | {" | ".join(f"{value:.1f}" for value in row)} |\n')
+
+
+def compare_repositories(first, second, first_file_metas_list: list[FileMeta], second_file_metas_list: list[FileMeta],
+                         report_directory: str = None, shared_candidate_pairs: dict[tuple[int, int], int] = None) -> ComparisonResult:
+    """
+    Compares two ingested repositories and writes the reports, into report_directory if given.
+    shared_candidate_pairs are candidate pairs by index in the given lists, from an index shared with other
+    repositories, otherwise they are generated here.
+    The mean similarity of the result is the one of all files of both repositories, files without a match count as 0%.
+    """
+    def report_path(report_file):
+        return os.path.join(report_directory, os.path.basename(report_file)) if report_directory else report_file
+    report_directory = report_directory or similarity_bar_chart_picture_directory
+
     first_file_hash_to_file_metas = {fm.file_hash: fm for fm in first_file_metas_list}
     second_file_hash_to_file_metas = {fm.file_hash: fm for fm in second_file_metas_list}
 
-    duplicated_files: list[FileComparison] = list()
-    partially_duplicated_files: list[FileComparison] = list()
+    # similarities of the matched pairs are counted as they are reported, the comparisons themselves are not kept
+    duplicated_similarities = SimilarityHistogram()
+    partially_duplicated_similarities = SimilarityHistogram()
     fully_unique_first: list[FileMeta] = list()
     fully_unique_second: list[FileMeta] = list()
-
-
-
-    for file_hash, file_meta in dict(first_file_hash_to_file_metas).items():
-        if file_hash in second_file_hash_to_file_metas:
-            duplicated_files.append(Comparator.compare_two_file_metas(file_meta, second_file_hash_to_file_metas[file_hash]))
-            del first_file_hash_to_file_metas[file_hash]
-            del second_file_hash_to_file_metas[file_hash]
-
-
-   # v3 extremely inefficient, but very promising approach
-
-    comparison_matrix: list[list[FileComparison]] = [
-        [Comparator.compare_two_file_metas(first_file_meta, second_file_meta)
-         for second_file_hash, second_file_meta in dict(second_file_hash_to_file_metas).items()]
-        for first_file_hash, first_file_meta in dict(first_file_hash_to_file_metas).items()
-    ]
-
-    comp_matrix_last_size = None
-    while comp_matrix_last_size != len(comparison_matrix):
-        if len(comparison_matrix) == 0 or len(comparison_matrix[0]) == 0:
-            break
-        comp_matrix_last_size = len(comparison_matrix)
-        for row in list(comparison_matrix):
-            # find best for first
-            best_for_first: FileComparison = row[0]
-            best_j = 0
-            for j, file_comparison in enumerate(row):
-                if file_comparison.get_similarity() > best_for_first.get_similarity():
-                    best_for_first = file_comparison
-                    best_j = j
-
-            # find best for second´
-            best_for_second: FileComparison = comparison_matrix[0][best_j]
-            best_i = 0
-            for i in range(len(comparison_matrix)):
-                file_comparison_2 = comparison_matrix[i][best_j]
-                if file_comparison_2.get_similarity() > best_for_second.get_similarity():
-                    best_for_second = file_comparison_2
-                    best_i = i
-
-            if best_for_second.first_file_meta is best_for_first.first_file_meta:
-                # match found
-                if best_for_first.get_similarity() == 100:
-                    duplicated_files.append(best_for_first)
-                elif best_for_first.get_similarity() > similarity_lower_bound:
-                    partially_duplicated_files.append(best_for_first)
-                else:
-                    continue
-
-                # delete row and column
-                comparison_matrix.pop(best_i)
-                for row in comparison_matrix:
-                    row.pop(best_j)
-                break
-
-
-    for row in list(comparison_matrix):
-        if row:
-            fully_unique_first.append(row[0].first_file_meta)
-
-    if comparison_matrix:
-        for comp in comparison_matrix[0]:
-            fully_unique_second.append(comp.second_file_meta)
+    matched_pairs: list[MatchedPair] = list()
+
+    # matched pairs are written as they are produced, their line lists are released once written
+    report_sink = MarkdownReportSink(report_path(duplicated_report_file), report_path(partially_duplicated_report_file),
+                                     report_path(partially_duplicated_detailed_report_file), max_buffered_report_pairs) \
+        if markdown_reports else None
+    structured_report_sink = StructuredReportSink(report_directory, structured_report_formats,
+                                                  structured_report_line_ranges) if structured_report_formats else None
+
+    def report_pair(file_comparison: FileComparison):
+        matched_pairs.append(MatchedPair(file_comparison.first_file_meta.file_path, file_comparison.second_file_meta.file_path,
+                                         file_comparison.get_similarity(), len(file_comparison.copied_blocks)))
+        if report_sink:
+            report_sink.add(file_comparison)
+        if structured_report_sink:
+            structured_report_sink.add(file_comparison)
+        file_comparison.release_lines()
+
+    with instrumentation.phase('identical files'):
+        for file_hash, file_meta in dict(first_file_hash_to_file_metas).items():
+            if file_hash in second_file_hash_to_file_metas:
+                file_comparison = Comparator.compare_two_file_metas(file_meta, second_file_hash_to_file_metas[file_hash])
+                duplicated_similarities.add(file_comparison.get_similarity())
+                report_pair(file_comparison)
+                del first_file_hash_to_file_metas[file_hash]
+                del second_file_hash_to_file_metas[file_hash]
+    instrumentation.count('identical pairs', len(duplicated_similarities))
+
+
+    # v4 only pairs sharing lines are compared, every other pair is 0% similar
+    first_file_metas = list(first_file_hash_to_file_metas.values())
+    second_file_metas = list(second_file_hash_to_file_metas.values())
+    if shared_candidate_pairs is not None:
+        first_positions = {id(file_meta): i for i, file_meta in enumerate(first_file_metas)}
+        second_positions = {id(file_meta): j for j, file_meta in enumerate(second_file_metas)}
+        candidate_pairs = {}
+        for i, j in shared_candidate_pairs:
+            first_position = first_positions.get(id(first_file_metas_list[i]))
+            second_position = second_positions.get(id(second_file_metas_list[j]))
+            if first_position is not None and second_position is not None:
+                candidate_pairs[(first_position, second_position)] = shared_candidate_pairs[(i, j)]
+        with instrumentation.phase('scoring'):
+            uniqueness_scores = Comparator.get_uniqueness_scores_for_pairs(first_file_metas, second_file_metas, candidate_pairs)
+        with instrumentation.phase('matching'):
+            matches = match(
+                [(i, j, 100 - uniqueness_score) for (i, j), uniqueness_score in uniqueness_scores.items()],
+                similarity_lower_bound,
+                matching_mode,
+            )
+    elif incremental_state_file and candidate_generation == LINE_INDEX:
+        # everything the stored scores and matches depend on, image scores on the perceptual hash distance
+        settings = (os.path.abspath(first), os.path.abspath(second), similarity_lower_bound, min_shared_lines,
+                    max_line_occurrences, matching_mode, Comparator.get_fingerprint_settings(),
+                    comparator.perceptual_hash_max_distance)
+        with instrumentation.phase('incremental scoring and matching'):
+            comparison_state = ComparisonState.load(incremental_state_file, settings)
+            uniqueness_scores, matches = score_and_match_incrementally(
+                comparison_state, first_file_metas, second_file_metas, similarity_lower_bound, min_shared_lines,
+                max_line_occurrences, matching_mode)
+            comparison_state.save(incremental_state_file)
+    else:
+        with instrumentation.phase('candidates'):
+            if candidate_generation == MINHASH:
+                candidate_pairs = MinHashIndex(first_file_metas, minhash_permutations, minhash_bands).get_candidate_pairs(
+                    MinHashIndex(second_file_metas, minhash_permutations, minhash_bands))
+            else:
+                candidate_pairs = LineHashIndex(first_file_metas).get_candidate_pairs(
+                    LineHashIndex(second_file_metas), min_shared_lines, max_line_occurrences)
+        with instrumentation.phase('scoring'):
+            uniqueness_scores = Comparator.get_uniqueness_scores_for_pairs(first_file_metas, second_file_metas, candidate_pairs)
+        print(f'{len(uniqueness_scores)} of {len(first_file_metas) * len(second_file_metas)} file pairs are candidates and were compared')
+
+        with instrumentation.phase('matching'):
+            matches = match(
+                [(i, j, 100 - uniqueness_score) for (i, j), uniqueness_score in uniqueness_scores.items()],
+                similarity_lower_bound,
+                matching_mode,
+            )
+    instrumentation.count('pairs skipped', len(first_file_metas) * len(second_file_metas) - len(uniqueness_scores))
+    instrumentation.count('matches accepted', len(matches))
+
+    # copied blocks are searched across all pairs of not identical files, matched or not, a file with an identical
+    # twin on the other side included
+    with instrumentation.phase('clone detection'):
+        clone_blocks = CloneDetector(clone_min_lines, clone_max_window_occurrences).find_blocks(
+            first_file_metas_list, second_file_metas_list) if clone_min_lines else []
+    pair_clone_blocks = defaultdict(list)
+    for block in sorted(clone_blocks, key=lambda block: (block.first_start_line, block.second_start_line)):
+        pair_clone_blocks[(block.first_file_meta.file_path, block.second_file_meta.file_path)].append(block)
+
+    with instrumentation.phase('reporting'), instrumentation.progress('Reporting', len(matches), 'pairs') as progress:
+        for i, j in matches:
+            # duplicate and unique lines are only collected for the pairs which are reported
+            file_comparison = Comparator.create_file_comparison(first_file_metas[i], second_file_metas[j], uniqueness_scores[(i, j)])
+            file_comparison.copied_blocks = pair_clone_blocks.get((first_file_metas[i].file_path, second_file_metas[j].file_path), [])
+            if file_comparison.get_similarity() == 100:
+                duplicated_similarities.add(100)
+            else:
+                partially_duplicated_similarities.add(file_comparison.get_similarity())
+            report_pair(file_comparison)
+            progress.advance()
+
+    # files left over once one side is exhausted are not reported as unique
+    matched_first = {i for i, _ in matches}
+    matched_second = {j for _, j in matches}
+    unmatched_first = [i for i in range(len(first_file_metas)) if i not in matched_first]
+    unmatched_second = [j for j in range(len(second_file_metas)) if j not in matched_second]
+
+    if unmatched_second:
+        fully_unique_first.extend(first_file_metas[i] for i in unmatched_first)
+
+    if unmatched_first:
+        fully_unique_second.extend(second_file_metas[j] for j in unmatched_second)
 
     # v2
     # file to matches
@@ -248,19 +371,28 @@ def traverse_directories(first, second):
 
     # write files
 
-    write_report_full_duplicates(duplicated_files)
-    write_report_partial_duplicates(partially_duplicated_files)
-    write_report_unique_files(fully_unique_first, fully_unique_second)
+    with instrumentation.phase('reporting'):
+        if report_sink:
+            report_sink.close()
+            write_report_unique_files(fully_unique_first, fully_unique_second, report_path(fully_unique_files))
+            if clone_min_lines:
+                write_clone_report(report_path(clone_report_file), clone_blocks, clone_min_lines)
+        if structured_report_sink:
+            structured_report_sink.add_unique_files(fully_unique_first, fully_unique_second)
+            structured_report_sink.close()
 
 
     # Crate plots
-    all_dups = duplicated_files + partially_duplicated_files
-
-    numbers = [file_comparison.get_similarity() for file_comparison in all_dups] + [0] * len(fully_unique_first)
-    plot_similarity_bar_chart(numbers, 'All files', save_to_file_path=f'{similarity_bar_chart_picture_directory}/all_files.png')
+    all_dups = duplicated_similarities + partially_duplicated_similarities
 
-    numbers2 = [file_comparison.get_similarity() for file_comparison in partially_duplicated_files] + [0] * len(fully_unique_first)
-    plot_similarity_bar_chart(numbers2, 'Full duplicates excluded', save_to_file_path=f'{similarity_bar_chart_picture_directory}/full_matches_excluded.png')
+    if plot_similarity_bar_charts:
+        from .plot import plot_similarity_bar_chart
+        with instrumentation.phase('plots'):
+            unique_first = SimilarityHistogram()
+            unique_first.add(0, len(fully_unique_first))
+            plot_similarity_bar_chart(all_dups + unique_first, 'All files', save_to_file_path=f'{report_directory}/all_files.png')
+            plot_similarity_bar_chart(partially_duplicated_similarities + unique_first, 'Full duplicates excluded',
+                                      save_to_file_path=f'{report_directory}/full_matches_excluded.png')
 
     # duplicated_lines_of_code = 0
     # unique_lines_of_code = 0
@@ -270,13 +402,23 @@ def traverse_directories(first, second):
     # unique_lines_of_code += len(fully_unique_first)
     #
     # print(f'Duplicated lines of code {duplicated_lines_of_code}, unique lines of code {unique_lines_of_code}')
-    threshold = 50
-    length_of_all_comparisons = len(all_dups) + len(fully_unique_first) + len(fully_unique_second)
-    length_of_over_threshold = len(list(filter(lambda x: x.get_similarity() > threshold, all_dups)))
-    print(f'{len(duplicated_files) * 1.0 / length_of_all_comparisons * 100}% are completely identical')
-    print(f'{length_of_over_threshold * 1.0 / length_of_all_comparisons * 100}% files have similarity above {threshold}%')
-
-
-
-def run():
-    traverse_directories(f'{european_root}', f'{asia_root}')
+    # files with the same content are compared once
+    file_count = len({fm.file_hash for fm in first_file_metas_list}) + len({fm.file_hash for fm in second_file_metas_list})
+    result = ComparisonResult(
+        first, second, matched_pairs,
+        # unlike in the reports, the files left over once one side is exhausted are unique as well
+        [first_file_metas[i].file_path for i in unmatched_first], [second_file_metas[j].file_path for j in unmatched_second],
+        all_dups, 2 * all_dups.get_sum() / file_count if file_count else 0.0, len(clone_blocks),
+        report_directory if markdown_reports or structured_report_formats or plot_similarity_bar_charts else None,
+    )
+    print(f'{result.get_identical_share()}% are completely identical')
+    print(f'{result.get_share_above(similarity_threshold)}% files have similarity above {similarity_threshold}%')
+    return result
+
+
+
+def run() -> t.Union[ComparisonResult, dict[tuple[str, str], ComparisonResult]]:
+    with instrumentation.instrumented(phase_summary, show_progress, trace_file, profile_file):
+        if repository_roots:
+            return traverse_repositories(repository_roots)
+        return traverse_directories(f'{european_root}', f'{asia_root}')
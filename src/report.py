@@ -0,0 +1,177 @@
+import heapq
+import pickle
+import shutil
+import tempfile
+import typing as t
+
+from .clones import CloneBlock
+from .comparator import FileComparison, LineMeta
+
+md_indent = '&nbsp;&nbsp;&nbsp;&nbsp;' \
+            ''
+write_buffer_size = 1 << 20
+
+
+def format_file_path(file_path):
+    return f'[{file_path}](../{file_path})'
+
+
+class MarkdownReportSink:
+    """
+    Writes the duplicated and partially duplicated reports while the matched pairs are produced.
+    Each pair is formatted once, when it is added, so its line lists can be released right afterwards.
+    Partial duplicates are reported sorted by uniqueness (ties in the order they were added): the formatted
+    entries are buffered up to max_buffered_pairs, spilled to sorted temporary runs and merged into both
+    markdown files in a single pass on close, so memory stays bounded by max_buffered_pairs.
+    """
+
+    def __init__(self, duplicated_report_file: str, partially_duplicated_report_file: str,
+                 partially_duplicated_detailed_report_file: str, max_buffered_pairs: int = 10000):
+        self.duplicated_report_file = duplicated_report_file
+        self.partially_duplicated_report_file = partially_duplicated_report_file
+        self.partially_duplicated_detailed_report_file = partially_duplicated_detailed_report_file
+        self.max_buffered_pairs = max_buffered_pairs
+
+        self.duplicated_count = 0
+        self.partially_duplicated_count = 0
+        # the counts lead the reports, the duplicates are collected in a temporary file until they are known
+        self._duplicated_body = tempfile.TemporaryFile('w+', buffering=write_buffer_size)
+        self._partial_buffer: list[tuple[int, int, str, str]] = []
+        self._partial_runs: list[t.BinaryIO] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+
+    def add(self, file_comparison: FileComparison):
+        if file_comparison.get_similarity() == 100:
+            self.add_duplicate(file_comparison)
+        else:
+            self.add_partial_duplicate(file_comparison)
+
+    def add_duplicate(self, file_comparison: FileComparison):
+        self.duplicated_count += 1
+        self._duplicated_body.write(
+            f'Identical files found:\\\n'
+            f'\t{md_indent}{format_file_path(file_comparison.first_file_meta.file_path)}\\\n'
+            f'\t{md_indent}{format_file_path(file_comparison.second_file_meta.file_path)}\n\n'
+        )
+
+    def add_partial_duplicate(self, file_comparison: FileComparison):
+        header = self.create_header(file_comparison)
+        first_path = format_file_path(file_comparison.first_file_meta.file_path)
+        second_path = format_file_path(file_comparison.second_file_meta.file_path)
+
+        summary = [header]
+        if file_comparison.first_file_meta.file_name != file_comparison.second_file_meta.file_name:
+            summary.append('File names differ\\\n')
+        summary.append(f'\t{md_indent}{first_path}\\\n')
+        summary.append(f'\t{md_indent}{second_path} \n\n')
+
+        detailed = [header, f'\t{md_indent}{first_path}\\\n', f'\t{md_indent}{second_path}\\\n']
+        detailed.append(f'\t{md_indent}Unique lines in first:\\\n')
+        for first_line_meta in sorted(file_comparison.unique_in_first, key=lambda line_meta: line_meta.line_nr):
+            detailed.append(self.create_diff_line_with_line_nr(first_line_meta))
+        detailed.append(f'\t{md_indent}Unique lines in second:\\\n')
+        for second_line_meta in sorted(file_comparison.unique_in_second, key=lambda line_meta: line_meta.line_nr):
+            detailed.append(self.create_diff_line_with_line_nr(second_line_meta))
+        if file_comparison.copied_blocks:
+            detailed.append(f'\t{md_indent}Copied blocks (first lines\t| second lines):\\\n')
+            for block in file_comparison.copied_blocks:
+                detailed.append(self.create_clone_block_line(block))
+        detailed.append(f'\n\n')
+
+        self._partial_buffer.append((file_comparison.uniqueness_score, self.partially_duplicated_count, ''.join(summary), ''.join(detailed)))
+        self.partially_duplicated_count += 1
+        if len(self._partial_buffer) >= self.max_buffered_pairs:
+            self._spill_partial_buffer()
+
+    @staticmethod
+    def create_header(file_comparison: FileComparison):
+        return f'Partially similar files found. First length {file_comparison.first_file_meta.line_count}, '\
+               f'Second length {file_comparison.second_file_meta.line_count},  '\
+               f'The files are {100 - file_comparison.uniqueness_score}% identical'\
+               f'The files differ in {max(len(file_comparison.unique_in_first), len(file_comparison.unique_in_second))} lines:\\\n'
+
+    @staticmethod
+    def create_diff_line_with_line_nr(line_meta: LineMeta):
+        return f'\t\t{md_indent*2}{line_meta.line_nr}\t| {line_meta.content}\\\n'
+
+    @staticmethod
+    def create_clone_block_line(block: CloneBlock):
+        return f'\t\t{md_indent*2}{block.first_start_line}-{block.first_end_line}\t| '\
+               f'{block.second_start_line}-{block.second_end_line} ({block.line_count} lines)\\\n'
+
+    def _spill_partial_buffer(self):
+        self._partial_buffer.sort(key=lambda entry: entry[:2])
+        run = tempfile.TemporaryFile('w+b', buffering=write_buffer_size)
+        for entry in self._partial_buffer:
+            pickle.dump(entry, run, pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self._partial_runs.append(run)
+        self._partial_buffer = []
+
+    @staticmethod
+    def _read_run(run: t.BinaryIO):
+        while True:
+            try:
+                yield pickle.load(run)
+            except EOFError:
+                return
+
+    def _sorted_partial_entries(self):
+        if not self._partial_runs:
+            return iter(sorted(self._partial_buffer, key=lambda entry: entry[:2]))
+        if self._partial_buffer:
+            self._spill_partial_buffer()
+        # (uniqueness, sequence) is unique, the formatted text is never compared
+        return heapq.merge(*[self._read_run(run) for run in self._partial_runs])
+
+    def close(self):
+        with open(self.duplicated_report_file, 'w+', buffering=write_buffer_size) as f_dup:
+            msg = f'Found {self.duplicated_count} fully identical files\n\n'
+            print(msg.replace('\n', ''))
+            f_dup.write(msg)
+            self._duplicated_body.seek(0)
+            shutil.copyfileobj(self._duplicated_body, f_dup)
+
+        msg = f'Found {self.partially_duplicated_count} partially duplicated files:\n\n'
+        print(msg.replace('\n', ''))
+        with open(self.partially_duplicated_report_file, 'w+', buffering=write_buffer_size) as f_part_dup, \
+                open(self.partially_duplicated_detailed_report_file, 'w+', buffering=write_buffer_size) as f_part_dup_detailed:
+            f_part_dup.write(msg)
+            f_part_dup_detailed.write(msg)
+            for _, _, summary, detailed in self._sorted_partial_entries():
+                f_part_dup.write(summary)
+                f_part_dup_detailed.write(detailed)
+        self._discard()
+
+    def _discard(self):
+        self._duplicated_body.close()
+        for run in self._partial_runs:
+            run.close()
+        self._partial_runs = []
+        self._partial_buffer = []
+
+
+def write_clone_report(clone_report_file: str, blocks: list[CloneBlock], min_lines: int):
+    """
+    Lists every copied or moved block, longest first, whether or not its files were matched with each other.
+    """
+    with open(clone_report_file, 'w+', buffering=write_buffer_size) as f_clones:
+        msg = f'Found {len(blocks)} copied blocks of at least {min_lines} consecutive lines\n\n'
+        print(msg.replace('\n', ''))
+        f_clones.write(msg)
+        for block in sorted(blocks, key=lambda block: -block.line_count):
+            f_clones.write(
+                f'Copied block of {block.line_count} lines:\\\n'
+                f'\t{md_indent}{format_file_path(block.first_file_meta.file_path)} '
+                f'lines {block.first_start_line}-{block.first_end_line}\\\n'
+                f'\t{md_indent}{format_file_path(block.second_file_meta.file_path)} '
+                f'lines {block.second_start_line}-{block.second_end_line}\n\n'
+            )
@@ -0,0 +1,79 @@
+import typing as t
+
+from .similarity_histogram import SimilarityHistogram
+
+
+class MatchedPair:
+    """
+    Two files matched between the compared repositories, identical files are 100% similar.
+    """
+    __slots__ = ('first_file_path', 'second_file_path', 'similarity', 'copied_block_count')
+
+    def __init__(self, first_file_path: str, second_file_path: str, similarity: int, copied_block_count: int = 0):
+        self.first_file_path = first_file_path
+        self.second_file_path = second_file_path
+        self.similarity = similarity
+        self.copied_block_count = copied_block_count
+
+    def as_dict(self) -> dict:
+        return {'first_file_path': self.first_file_path, 'second_file_path': self.second_file_path,
+                'similarity': self.similarity, 'copied_block_count': self.copied_block_count}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}( {self.similarity}%, {self.first_file_path} <> {self.second_file_path} )"
+
+
+class ComparisonResult:
+    """
+    What a comparison of two repositories found: the matched pairs in the order they were reported, every file of
+    either side without a match and the similarities of the matched pairs. Shares are of all compared files,
+    a matched pair counting once.
+    """
+
+    def __init__(self, first: str, second: str, matched_pairs: list[MatchedPair], unique_first: list[str],
+                 unique_second: list[str], similarities: SimilarityHistogram, mean_similarity: float,
+                 clone_block_count: int = 0, report_directory: t.Optional[str] = None):
+        self.first = first
+        self.second = second
+        self.matched_pairs = matched_pairs
+        self.unique_first = unique_first
+        self.unique_second = unique_second
+        self.similarities = similarities
+        self.mean_similarity = mean_similarity
+        self.clone_block_count = clone_block_count
+        self.report_directory = report_directory
+
+    @property
+    def identical_pairs(self) -> list[MatchedPair]:
+        return [pair for pair in self.matched_pairs if pair.similarity == 100]
+
+    @property
+    def partially_duplicated_pairs(self) -> list[MatchedPair]:
+        return [pair for pair in self.matched_pairs if pair.similarity != 100]
+
+    def get_compared_file_count(self) -> int:
+        return len(self.similarities) + len(self.unique_first) + len(self.unique_second)
+
+    def get_identical_share(self) -> float:
+        file_count = self.get_compared_file_count()
+        return self.similarities.count_at_least(100) * 1.0 / file_count * 100 if file_count else 0.0
+
+    def get_share_above(self, threshold: int) -> float:
+        file_count = self.get_compared_file_count()
+        return self.similarities.count_above(threshold) * 1.0 / file_count * 100 if file_count else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'first': self.first, 'second': self.second, 'mean_similarity': self.mean_similarity,
+            'identical_count': self.similarities.count_at_least(100),
+            'partially_duplicated_count': len(self.similarities) - self.similarities.count_at_least(100),
+            'unique_first_count': len(self.unique_first), 'unique_second_count': len(self.unique_second),
+            'clone_block_count': self.clone_block_count,
+            'similarity_histogram': self.similarities.counts.tolist(),
+            'matched_pairs': [pair.as_dict() for pair in self.matched_pairs],
+            'unique_first': self.unique_first, 'unique_second': self.unique_second,
+        }
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}( {self.first} <> {self.second}, {len(self.matched_pairs)} matched pairs, " \
+               f"{len(self.unique_first)} and {len(self.unique_second)} unique files, {self.mean_similarity:.1f}% mean similarity )"
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class SimilarityHistogram:
+    """
+    Counts of file similarities by whole percent, added as pairs are matched, so that statistics and charts of a run
+    need neither a list of all comparisons nor a pass over them. Any threshold is answered from the 101 counters,
+    the bars of a chart are sums of them.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(101, dtype=np.int64)
+
+    def add(self, similarity: int, count: int = 1):
+        self.counts[int(similarity)] += count
+
+    def __add__(self, other: 'SimilarityHistogram') -> 'SimilarityHistogram':
+        histogram = SimilarityHistogram()
+        histogram.counts = self.counts + other.counts
+        return histogram
+
+    def __len__(self) -> int:
+        return int(self.counts.sum())
+
+    def count_above(self, similarity: int) -> int:
+        return int(self.counts[int(similarity) + 1:].sum())
+
+    def count_at_least(self, similarity: int) -> int:
+        return int(self.counts[int(similarity):].sum())
+
+    def get_sum(self) -> int:
+        return int(self.counts @ np.arange(101))
+
+    def get_bins(self, bin_width: int = 5) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the bin edges from 0 to 100 and the count of every bin, the last bin includes 100 like in plt.hist.
+        """
+        edges = np.arange(0, 101, bin_width)
+        bin_counts = np.add.reduceat(self.counts[:100], edges[:-1])
+        bin_counts[-1] += self.counts[100]
+        return edges, bin_counts